@@ -0,0 +1,160 @@
+# Daniel Vitor de Oliveira Santos, 716417, Ciência da Computação Coração Eucarístico
+# Guilherme Cosso Lima Pimenta, gclpimenta@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+# Larissa Kaweski Siqueira, larissa.kaweski@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+from pathlib import Path
+import numpy as np
+
+from models import CLASS_NAMES, ModelRegistry, preprocess_batch, decode_prediction
+from embedding_cache import EmbeddingCache
+from engines import ENGINES
+from pipeline import StreamingPipeline, load_stage
+from segmentation import set_gamma_precision, set_mask_scale
+
+# Image formats accepted, the same as the window
+IMAGE_EXTENSIONS = ('.png', '.tiff', '.tif', '.jpg', '.jpeg')
+
+# Get the images from directories, files and lists of files (@list.txt)
+def collect_paths(inputs):
+    paths = []
+    for item in inputs:
+        if item.startswith('@'):
+            with open(item[1:], encoding='utf-8') as file:
+                paths.extend(line.strip() for line in file if line.strip())
+        elif os.path.isdir(item):
+            paths.extend(sorted(str(path) for path in Path(item).glob('**/*') if path.suffix.lower() in IMAGE_EXTENSIONS))
+        else:
+            paths.append(item)
+    return paths
+
+# Split a list in parts of the batch size
+def batches(items, batch_size):
+    for i in range(0, len(items), batch_size):
+        yield items[i:i + batch_size]
+
+# Build the result of an image from the outputs of the models
+def build_row(path, predictions, index):
+    row = {'path': path}
+    for name, prediction in predictions.items():
+        label, confidence = decode_prediction(name, prediction[index])
+        row[f'{name}_label'] = label
+        row[f'{name}_confidence'] = float(confidence)
+        for class_name, probability in zip(CLASS_NAMES[name], prediction[index]):
+            row[f'{name}_{class_name}'] = float(probability)
+    return row
+
+# Classify the loaded images of a batch, every model sharing the backbone pass
+def classify_loaded(registry, names, loaded):
+    valid = [image for _, image in loaded if not isinstance(image, Exception)]
+    if valid:
+        predictions = registry.predict_all(preprocess_batch(np.stack(valid)), names)
+
+    # Rows in the order of the paths, the unreadable images keep their place with the error
+    rows = []
+    index = 0
+    for path, image in loaded:
+        if isinstance(image, Exception):
+            rows.append({'path': path, 'error': str(image)})
+        else:
+            rows.append(build_row(path, predictions, index))
+            index += 1
+    return rows
+
+# Classify images in batches, yielding one result per image
+def classify_paths(registry, paths, names, batch_size=32, segment=True):
+    for batch_paths in batches(paths, batch_size):
+        loaded = [load_stage(path, segment)[:2] for path in batch_paths]
+        yield from classify_loaded(registry, names, loaded)
+
+# Columns of the CSV file
+def csv_columns(names):
+    columns = ['path']
+    for name in names:
+        columns += [f'{name}_label', f'{name}_confidence'] + [f'{name}_{class_name}' for class_name in CLASS_NAMES[name]]
+    return columns + ['error']
+
+# Write the results while they are produced, as CSV or JSON lines
+def write_results(rows, output, names, output_format):
+    count = 0
+    with open(output, 'w', newline='', encoding='utf-8') as file:
+        if output_format == 'csv':
+            writer = csv.DictWriter(file, fieldnames=csv_columns(names))
+            writer.writeheader()
+        for row in rows:
+            if output_format == 'csv':
+                writer.writerow(row)
+            else:
+                file.write(json.dumps(row) + '\n')
+            count += 1
+    return count
+
+# Read the command line options
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Classify mammograms without opening the window.')
+    parser.add_argument('inputs', nargs='+', help='images, directories or @file with one path per line')
+    parser.add_argument('-o', '--output', default='results.csv', help='output file (.csv or .jsonl)')
+    parser.add_argument('--format', choices=['csv', 'jsonl'], default=None,
+                        help='output format, by default taken from the output extension')
+    parser.add_argument('--models', nargs='+', choices=list(CLASS_NAMES), default=list(CLASS_NAMES))
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--no-segment', action='store_true', help='the images are already segmented')
+    parser.add_argument('--cache-dir', default=None, help='directory to keep the results between runs')
+    parser.add_argument('--engine', choices=ENGINES, default='keras',
+                        help='runtime of the models, tflite needs export_models.py to be run first')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='processes decoding and segmenting while the model runs (0 runs everything in sequence)')
+    parser.add_argument('--queue-depth', type=int, default=64,
+                        help='maximum decoded images waiting for the model')
+    parser.add_argument('--gamma-precision', type=float, default=None,
+                        help='round gamma to this precision so images share gamma tables (exact by default)')
+    parser.add_argument('--mask-scale', type=int, default=1,
+                        help='compute the breast mask of bright images (Otsu branch) on the image reduced by this factor (1 for full resolution)')
+    args = parser.parse_args(argv)
+
+    if args.format is None:
+        args.format = 'jsonl' if args.output.endswith(('.jsonl', '.json')) else 'csv'
+    if args.batch_size < 1:
+        parser.error('--batch-size must be at least 1')
+    if args.queue_depth < 1:
+        parser.error('--queue-depth must be at least 1')
+    if args.mask_scale < 1:
+        parser.error('--mask-scale must be at least 1')
+    return args
+
+# Main function
+def main(argv=None):
+    args = parse_args(argv)
+    paths = collect_paths(args.inputs)
+    registry = ModelRegistry(cache=EmbeddingCache(directory=args.cache_dir), engine=args.engine)
+
+    # Load the models before counting the time
+    for name in args.models:
+        registry.get(name)
+
+    set_gamma_precision(args.gamma_precision)
+    set_mask_scale(args.mask_scale)
+    start_time = time.time()
+    if args.workers > 0:
+        pipeline = StreamingPipeline(args.workers, args.queue_depth, args.batch_size, not args.no_segment,
+                                     args.gamma_precision, args.mask_scale)
+        rows = pipeline.run(paths, lambda loaded: classify_loaded(registry, args.models, loaded))
+    else:
+        pipeline = None
+        rows = classify_paths(registry, paths, args.models, args.batch_size, not args.no_segment)
+    count = write_results(rows, args.output, args.models, args.format)
+    elapsed_time = time.time() - start_time
+
+    if pipeline is not None:
+        print(pipeline.report())
+
+    rate = count / elapsed_time * 3600 if elapsed_time > 0 else 0
+    print(f'{count} images in {round(elapsed_time, 2)}s ({round(rate)} images/hour), results in {args.output}')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,72 @@
+# Daniel Vitor de Oliveira Santos, 716417, Ciência da Computação Coração Eucarístico
+# Guilherme Cosso Lima Pimenta, gclpimenta@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+# Larissa Kaweski Siqueira, larissa.kaweski@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+import sys
+import time
+import argparse
+import numpy as np
+
+from models import CLASS_NAMES, IMAGE_SIZE, MODEL_PATHS, preprocess_batch
+from engines import KerasEngine
+
+# Median time of a function over the inputs, after one call to warm it up
+def measure(function, inputs, repeats):
+    function(inputs[0])
+    times = []
+    for _ in range(repeats):
+        for batch in inputs:
+            start_time = time.perf_counter()
+            function(batch)
+            times.append(time.perf_counter() - start_time)
+    return float(np.median(times))
+
+# Compare Model.predict with the compiled functions on the same images
+def benchmark(name, batch_size=1, count=10, repeats=5, seed=42):
+    from tensorflow.keras.models import load_model
+
+    random = np.random.default_rng(seed)
+    images = random.integers(0, 256, size=(count, batch_size, IMAGE_SIZE, IMAGE_SIZE, 3), dtype=np.uint8)
+    inputs = [preprocess_batch(batch) for batch in images]
+
+    # Current path of the application before the compiled functions
+    model = load_model(MODEL_PATHS[name])
+    predict = lambda batch: model.predict(batch, verbose=0)
+    results = {'predict': measure(predict, inputs, repeats)}
+    expected = np.concatenate([predict(batch) for batch in inputs])
+
+    for label, jit_compile in (('tf.function', False), ('tf.function + XLA', True)):
+        loaded = KerasEngine(MODEL_PATHS, jit_compile=jit_compile).load(name)
+        compiled = lambda batch: loaded.head(loaded.backbone(batch))
+        try:
+            results[label] = measure(compiled, inputs, repeats)
+        except Exception as error:
+            # XLA is not available on every device
+            print(f'{label}: not available ({error.__class__.__name__})')
+            continue
+        difference = np.max(np.abs(np.concatenate([compiled(batch) for batch in inputs]) - expected))
+        print(f'{label}: max difference to predict {difference:.2e}')
+    return results
+
+# Read the command line options
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Compare Model.predict with the compiled inference functions.')
+    parser.add_argument('--models', nargs='+', choices=list(CLASS_NAMES), default=['binary'])
+    parser.add_argument('--batch-sizes', nargs='+', type=int, default=[1, 8])
+    parser.add_argument('--count', type=int, default=10, help='different batches per measure')
+    parser.add_argument('--repeats', type=int, default=5)
+    return parser.parse_args(argv)
+
+# Main function
+def main(argv=None):
+    args = parse_args(argv)
+    for name in args.models:
+        for batch_size in args.batch_sizes:
+            print(f'== {name}, batch of {batch_size} ==')
+            results = benchmark(name, batch_size, args.count, args.repeats)
+            for label, seconds in results.items():
+                speedup = results['predict'] / seconds
+                print(f'{label}: {round(seconds * 1000, 2)} ms per batch ({round(speedup, 2)}x)')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,173 @@
+# Daniel Vitor de Oliveira Santos, 716417, Ciência da Computação Coração Eucarístico
+# Guilherme Cosso Lima Pimenta, gclpimenta@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+# Larissa Kaweski Siqueira, larissa.kaweski@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+import sys
+import time
+import argparse
+import tracemalloc
+import cv2
+import numpy as np
+
+from segmentation import GammaLUTCache, SegmentationEngine, crop_image, find_optimal_gamma, gamma_lut, mask_iou, segment_image_reference
+
+# Create a synthetic mammogram: a bright breast, noise, a label and small objects
+def synthetic_mammogram(height, width, brightness=170, seed=42):
+    random = np.random.default_rng(seed)
+    image = random.integers(0, 12, size=(height, width), dtype=np.uint8)
+
+    # Breast as a half ellipse leaving the left border
+    cv2.ellipse(image, (0, height // 2), (int(width * 0.6), int(height * 0.42)), 0, -90, 90, brightness, -1)
+    texture = random.integers(0, 60, size=(height, width), dtype=np.uint8)
+    breast = image >= brightness
+    image[breast] = image[breast] - texture[breast] // 2
+
+    # Label and small objects that segmentation has to remove
+    cv2.rectangle(image, (int(width * 0.8), int(height * 0.05)), (int(width * 0.95), int(height * 0.12)), 255, -1)
+    for _ in range(20):
+        center = (int(random.integers(width // 2, width)), int(random.integers(0, height)))
+        cv2.circle(image, center, int(random.integers(5, 40)), int(random.integers(100, 256)), -1)
+    return image
+
+# Median time and numpy memory peak of a function
+def measure(function, image, repeats):
+    tracemalloc.start()
+    function(image)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    times = []
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        function(image)
+        times.append(time.perf_counter() - start_time)
+    return float(np.median(times)), peak
+
+# Compare the reference segmentation with the engine
+def benchmark(height, width, brightness, repeats):
+    image = synthetic_mammogram(height, width, brightness)
+    engine = SegmentationEngine()
+    engine.segment(image)
+
+    reference_time, reference_peak = measure(segment_image_reference, image, repeats)
+    engine_time, engine_peak = measure(engine.segment, image, repeats)
+    identical = np.array_equal(segment_image_reference(image), engine.segment(image))
+
+    print(f'== {width}x{height}, mean {round(float(np.mean(image)), 1)} ==')
+    print(f'reference: {round(reference_time * 1000, 1)} ms, {round(reference_peak / 2**20, 1)} MB of numpy temporaries')
+    print(f'engine: {round(engine_time * 1000, 1)} ms, {round(engine_peak / 2**20, 1)} MB of numpy temporaries')
+    print(f'speedup {round(reference_time / engine_time, 2)}x, identical output: {identical}')
+    return identical
+
+# Compare the masks computed on reduced images with the full resolution mask
+#
+# Only the Otsu branch (gamma >= 0.6) is reduced, so the image has to take it.
+def benchmark_scales(height, width, brightness, scales, repeats):
+    image = synthetic_mammogram(height, width, brightness)
+    if find_optimal_gamma(image) < 0.6:
+        raise ValueError(f'a brightness of {brightness} takes the fixed threshold branch, which the mask scale '
+                         'does not change')
+    full = SegmentationEngine()
+    full_time, _ = measure(full.compute_mask, image, repeats)
+    reference = full.compute_mask(image)[1].copy()
+
+    print(f'== mask scale, {width}x{height}, mean {round(float(np.mean(image)), 1)} ==')
+    print(f'full resolution: {round(full_time * 1000, 1)} ms')
+    for scale in scales:
+        engine = SegmentationEngine(scale=scale)
+        engine_time, _ = measure(engine.compute_mask, image, repeats)
+        iou = mask_iou(engine.compute_mask(image)[1], reference)
+        print(f'1/{scale}: {round(engine_time * 1000, 1)} ms ({round(full_time / engine_time, 2)}x), '
+              f'IoU {round(iou, 5)}')
+
+# Worst difference between the exact tables and the rounded ones, measured over sampled gammas
+#
+# The filtered pixel only depends on its own value through the table, so a pixel
+# can only change if its value is one of the table entries that changed, and by
+# at most the largest difference of those entries. The gammas between 0.6
+# (below it gamma is not applied) and log(255) / log(512) (mean of 255) are
+# sampled at steps points, so this is a measured bound, not a proof for every
+# gamma in between.
+def quantization_bound(precision, steps=20001):
+    cache = GammaLUTCache(precision)
+    worst_entries = 0
+    worst_difference = 0
+    for gamma in np.linspace(0.6, np.log(255) / np.log(512), steps):
+        exact = gamma_lut(gamma).astype(np.int16)
+        rounded = gamma_lut(cache.quantize(gamma)).astype(np.int16)
+        difference = np.abs(exact - rounded)
+        worst_entries = max(worst_entries, int(np.count_nonzero(difference)))
+        worst_difference = max(worst_difference, int(difference.max()))
+    return worst_entries, worst_difference
+
+# Check the rounded gamma tables: bound, pixels changed and cache hits on a batch
+#
+# The filtered images are made from the tables directly, outside the caches, so
+# the hits and misses are only the ones of segment. The rounding changes some
+# filtered pixels by one gray level, the check is that the segmented images stay
+# the same as with the exact tables. True if they did for every image.
+def check_gamma_precision(precision, height, width, count=50, steps=20001):
+    entries, difference = quantization_bound(precision, steps)
+    print(f'== gamma rounded to {precision} ==')
+    print(f'measured on {steps} gammas: at most {entries} of the 256 table entries change, '
+          f'by at most {difference} gray level(s)')
+
+    exact = SegmentationEngine(GammaLUTCache(None))
+    rounded = SegmentationEngine(GammaLUTCache(precision))
+    filtered_changed = []
+    segmented_changed = []
+    for i in range(count):
+        # Images with slightly different brightness, as in a real dataset
+        image = synthetic_mammogram(height, width, brightness=180 + i % 50, seed=i)
+        gamma = find_optimal_gamma(image)
+        if gamma < 0.6:
+            continue
+        cropped = crop_image(image)
+        exact_filtered = cv2.LUT(cropped, gamma_lut(gamma))
+        rounded_filtered = cv2.LUT(cropped, gamma_lut(rounded.lut_cache.quantize(gamma)))
+        filtered_changed.append(np.count_nonzero(exact_filtered != rounded_filtered) / exact_filtered.size)
+        segmented_changed.append(int(np.count_nonzero(exact.segment(image) != rounded.segment(image))))
+
+    if not filtered_changed:
+        print('no image used the gamma correction')
+        return True
+
+    stats = rounded.lut_cache.stats()
+    print(f'filtered pixels changed: at most {round(max(filtered_changed) * 100, 3)}% of the image '
+          f'(worst of {len(filtered_changed)} images)')
+    print(f'segmented pixels changed: at most {max(segmented_changed)} pixel(s) per image')
+    print(f"table cache: {stats['hits']} hits, {stats['misses']} misses, {stats['size']} tables, "
+          f"hit rate {round(stats['hit_rate'] * 100, 1)}%")
+    return max(segmented_changed) == 0
+
+# Read the command line options
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Compare the reference segmentation with the segmentation engine.')
+    parser.add_argument('--sizes', nargs='+', default=['4096x3328', '5632x4096'], help='HEIGHTxWIDTH of the images')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--mask-scales', nargs='*', type=int, default=[4, 8],
+                        help='also compare the masks computed on images reduced by these factors')
+    parser.add_argument('--gamma-precision', type=float, default=None,
+                        help='also check the gamma table cache with gamma rounded to this precision')
+    return parser.parse_args(argv)
+
+# Main function
+def main(argv=None):
+    args = parse_args(argv)
+    identical = True
+    for size in args.sizes:
+        height, width = map(int, size.lower().split('x'))
+
+        # Bright images go through gamma and Otsu, dark ones through the fixed threshold
+        for brightness in (230, 60):
+            identical &= benchmark(height, width, brightness, args.repeats)
+
+        # The mask scale only changes the Otsu branch, so it is measured on the bright image
+        if args.mask_scales:
+            benchmark_scales(height, width, 230, args.mask_scales, args.repeats)
+
+    if args.gamma_precision:
+        identical &= check_gamma_precision(args.gamma_precision, 1024, 832)
+    return 0 if identical else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
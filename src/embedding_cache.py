@@ -0,0 +1,147 @@
+# Daniel Vitor de Oliveira Santos, 716417, Ciência da Computação Coração Eucarístico
+# Guilherme Cosso Lima Pimenta, gclpimenta@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+# Larissa Kaweski Siqueira, larissa.kaweski@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+import os
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# Default memory budget, about 8000 images with the 2048 float32 features
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+# Hash of one preprocessed image, used as the cache key
+def image_key(fingerprint, image):
+    digest = hashlib.sha1(fingerprint.encode())
+    digest.update(str(image.shape).encode())
+    digest.update(str(image.dtype).encode())
+    digest.update(np.ascontiguousarray(image).tobytes())
+    return digest.hexdigest()
+
+# Backbone features and model outputs of a single image
+class CacheEntry:
+    def __init__(self, embedding=None, outputs=None):
+        self.embedding = embedding
+        self.outputs = dict(outputs or {})
+
+    # Memory used by the arrays of the entry
+    def nbytes(self):
+        size = 0 if self.embedding is None else self.embedding.nbytes
+        return size + sum(output.nbytes for output in self.outputs.values())
+
+# LRU cache of embeddings and outputs, limited by memory, optionally saved on disk
+class EmbeddingCache:
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, directory=None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    def __len__(self):
+        return len(self.entries)
+
+    # Get the entry of an image, looking on disk if not in memory
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry
+
+        entry = self.read(key)
+        with self.lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+
+            # Another thread may have added the image while the file was read
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+            self.insert(key, entry)
+        return entry
+
+    # Store the embedding and/or an output of an image
+    #
+    # The file is written from a copy of the entry taken under the lock, while
+    # other threads may add outputs to it. The writes of the cache are done one
+    # at a time and each copies the entry when it starts, so the last file
+    # written has every output stored before it.
+    def put(self, key, embedding=None, outputs=None):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.size -= entry.nbytes()
+            else:
+                entry = CacheEntry()
+            if embedding is not None:
+                entry.embedding = embedding
+            entry.outputs.update(outputs or {})
+            self.insert(key, entry)
+        if self.directory:
+            with self.write_lock:
+                with self.lock:
+                    current = self.entries.get(key, entry)
+                    snapshot = CacheEntry(current.embedding, current.outputs)
+                self.write(key, snapshot)
+        return entry
+
+    # Add an entry, removing the least recently used ones above the budget
+    def insert(self, key, entry):
+        self.entries[key] = entry
+        self.size += entry.nbytes()
+        while self.size > self.max_bytes and len(self.entries) > 1:
+            _, removed = self.entries.popitem(last=False)
+            self.size -= removed.nbytes()
+
+    # Remove everything from memory, keeping the files on disk
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    # Path of the file of an entry
+    def path(self, key):
+        return os.path.join(self.directory, f'{key}.npz')
+
+    # Read an entry from disk
+    def read(self, key):
+        if not self.directory or not os.path.exists(self.path(key)):
+            return None
+
+        try:
+            with np.load(self.path(key)) as data:
+                embedding = data['embedding'] if 'embedding' in data.files else None
+                outputs = {name[len('output_'):]: data[name] for name in data.files if name.startswith('output_')}
+        except (OSError, ValueError):
+            # Broken file, it will be written again
+            return None
+        return CacheEntry(embedding, outputs)
+
+    # Save an entry on disk, replacing the file only when it is complete
+    def write(self, key, entry):
+        if not self.directory:
+            return
+
+        arrays = {f'output_{name}': output for name, output in entry.outputs.items()}
+        if entry.embedding is not None:
+            arrays['embedding'] = entry.embedding
+
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                np.savez(file, **arrays)
+            os.replace(temp_path, self.path(key))
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
@@ -0,0 +1,178 @@
+# Daniel Vitor de Oliveira Santos, 716417, Ciência da Computação Coração Eucarístico
+# Guilherme Cosso Lima Pimenta, gclpimenta@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+# Larissa Kaweski Siqueira, larissa.kaweski@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+import os
+import gc
+import json
+import hashlib
+import threading
+import numpy as np
+
+# Engines that can run the models
+ENGINES = ['keras', 'keras-xla', 'tflite', 'tflite-int8']
+
+# File written by the export, describing the converted models
+MANIFEST_NAME = 'manifest.json'
+
+# Compute a hash of the weights, used to know if two backbones are the same
+def weights_fingerprint(model):
+    digest = hashlib.sha1()
+    for weight in model.get_weights():
+        digest.update(str(weight.shape).encode())
+        digest.update(np.ascontiguousarray(weight).tobytes())
+    return digest.hexdigest()
+
+# Split a trained Sequential(ResNet50, head) into the backbone and the head
+def split_model(model, name):
+    import tensorflow as tf
+
+    backbone = model.layers[0]
+    if not isinstance(backbone, tf.keras.Model):
+        raise ValueError(f'the {name} model does not start with the ResNet50 backbone')
+
+    # Rebuild the head on top of the 2048 features, reusing the trained layers
+    inputs = tf.keras.Input(shape=backbone.output_shape[1:])
+    head = tf.keras.Sequential([inputs] + model.layers[1:], name=f'{name}_head')
+    return backbone, head
+
+# Build a tf.function with a fixed (None, ...) float32 signature, traced only once
+#
+# Calling it directly avoids the work Model.predict does on every call (data
+# adapter, callbacks, new tf.function dispatch), which dominates for one image.
+def compile_model(model, jit_compile=False):
+    import tensorflow as tf
+
+    signature = tf.TensorSpec(shape=(None,) + tuple(model.input_shape[1:]), dtype=tf.float32)
+    function = tf.function(lambda batch: model(batch, training=False), input_signature=[signature],
+                           jit_compile=jit_compile)
+    return lambda batch: function(tf.convert_to_tensor(batch, dtype=tf.float32)).numpy()
+
+# A model loaded by an engine: backbone and head as functions from numpy to numpy
+class LoadedModel:
+    def __init__(self, fingerprint, backbone, head, head_fingerprint):
+        self.fingerprint = fingerprint
+        self.backbone = backbone
+        self.head = head
+        self.head_fingerprint = head_fingerprint
+
+# Run the .hdf5 models with Keras
+class KerasEngine:
+    name = 'keras'
+
+    def __init__(self, paths, jit_compile=False):
+        self.paths = paths
+        self.jit_compile = jit_compile
+
+        # Keras models, used to build the combined model and the exports
+        self.backbone_models = {}
+        self.head_models = {}
+
+        # Compiled backbones, by fingerprint
+        self.backbones = {}
+
+    def load(self, name):
+        # Import here, TensorFlow alone takes seconds to load
+        from tensorflow.keras.models import load_model
+
+        model = load_model(self.paths[name])
+        backbone, head = split_model(model, name)
+        fingerprint = weights_fingerprint(backbone)
+
+        # Keep only the first copy of identical backbones
+        if fingerprint not in self.backbone_models:
+            self.backbone_models[fingerprint] = backbone
+            self.backbones[fingerprint] = compile_model(backbone, self.jit_compile)
+        self.head_models[name] = head
+        del model, backbone
+        gc.collect()
+
+        return LoadedModel(fingerprint, self.backbones[fingerprint], compile_model(head, self.jit_compile),
+                           weights_fingerprint(head))
+
+    # Free the Keras models of an unloaded model
+    def release(self, name, fingerprint=None):
+        self.head_models.pop(name, None)
+        if fingerprint is not None:
+            self.backbone_models.pop(fingerprint, None)
+            self.backbones.pop(fingerprint, None)
+
+# Import the TFLite interpreter, preferring the small tflite_runtime package
+def tflite_interpreter():
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        from tensorflow.lite import Interpreter
+    return Interpreter
+
+# Run a .tflite file, resizing the batch dimension when needed
+class TFLiteRunner:
+    def __init__(self, path, num_threads=None):
+        Interpreter = tflite_interpreter()
+
+        # The XNNPACK delegate is applied by default to float models
+        self.interpreter = Interpreter(model_path=path, num_threads=num_threads or os.cpu_count())
+        self.input_index = self.interpreter.get_input_details()[0]['index']
+        self.output_index = self.interpreter.get_output_details()[0]['index']
+        self.input_shape = None
+        self.lock = threading.Lock()
+
+    def __call__(self, batch):
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        with self.lock:
+            if self.input_shape != batch.shape:
+                self.interpreter.resize_tensor_input(self.input_index, batch.shape)
+                self.interpreter.allocate_tensors()
+                self.input_shape = batch.shape
+            self.interpreter.set_tensor(self.input_index, batch)
+            self.interpreter.invoke()
+            return self.interpreter.get_tensor(self.output_index).copy()
+
+# Run the models converted by export_models.py
+class TFLiteEngine:
+    name = 'tflite'
+
+    def __init__(self, directory, variant='float32', num_threads=None):
+        self.directory = directory
+        self.variant = variant
+        self.num_threads = num_threads
+        self.backbones = {}
+
+        manifest_path = os.path.join(directory, MANIFEST_NAME)
+        if not os.path.exists(manifest_path):
+            raise FileNotFoundError(f'{manifest_path} not found, run export_models.py first')
+        with open(manifest_path, encoding='utf-8') as file:
+            self.manifest = json.load(file)
+
+    def load(self, name):
+        if name not in self.manifest['models']:
+            raise KeyError(f'the {name} model was not exported to {self.directory}')
+        entry = self.manifest['models'][name]
+        if self.variant not in entry['files']:
+            raise KeyError(f'the {self.variant} version of the {name} model was not exported to {self.directory}')
+        files = entry['files'][self.variant]
+
+        # Results of a converted model are not mixed in the cache with the Keras ones
+        fingerprint = f'{entry["backbone_fingerprint"]}-tflite-{self.variant}'
+        if fingerprint not in self.backbones:
+            self.backbones[fingerprint] = TFLiteRunner(os.path.join(self.directory, files['backbone']), self.num_threads)
+        head = TFLiteRunner(os.path.join(self.directory, files['head']), self.num_threads)
+
+        return LoadedModel(fingerprint, self.backbones[fingerprint], head,
+                           f'{entry["head_fingerprint"]}-tflite-{self.variant}')
+
+    # Free the interpreters of an unloaded model
+    def release(self, name, fingerprint=None):
+        if fingerprint is not None:
+            self.backbones.pop(fingerprint, None)
+
+# Create the engine by its name
+def make_engine(name, paths, export_dir):
+    if name == 'keras':
+        return KerasEngine(paths)
+    if name == 'keras-xla':
+        return KerasEngine(paths, jit_compile=True)
+    if name == 'tflite':
+        return TFLiteEngine(export_dir)
+    if name == 'tflite-int8':
+        return TFLiteEngine(export_dir, variant='int8')
+    raise ValueError(f'unknown engine {name}, use one of {ENGINES}')
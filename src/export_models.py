@@ -0,0 +1,147 @@
+# Daniel Vitor de Oliveira Santos, 716417, Ciência da Computação Coração Eucarístico
+# Guilherme Cosso Lima Pimenta, gclpimenta@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+# Larissa Kaweski Siqueira, larissa.kaweski@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+import os
+import sys
+import json
+import argparse
+import numpy as np
+
+from models import CLASS_NAMES, EXPORT_DIR, IMAGE_SIZE, MODEL_PATHS, ModelRegistry, preprocess_batch
+from embedding_cache import EmbeddingCache
+from engines import MANIFEST_NAME, KerasEngine
+from pipeline import load_stage
+
+# Largest difference of probabilities accepted between Keras and the converted model
+DEFAULT_TOLERANCE = 1e-4
+
+# Read the manifest of the exported models, or start a new one
+def read_manifest(directory):
+    path = os.path.join(directory, MANIFEST_NAME)
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as file:
+            return json.load(file)
+    return {'models': {}}
+
+# Save the manifest of the exported models
+def write_manifest(directory, manifest):
+    with open(os.path.join(directory, MANIFEST_NAME), 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, indent=2)
+
+# Convert a Keras model to TFLite, to INT8 when calibration data is given
+def convert(model, representative_dataset=None):
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if representative_dataset is not None:
+        # Weights and activations in INT8, the inputs and outputs stay float32
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    return converter.convert()
+
+# Write a converted model
+def write_model(directory, filename, content):
+    with open(os.path.join(directory, filename), 'wb') as file:
+        file.write(content)
+
+# Convert the backbone and the heads of the models, sharing the backbone file
+#
+# calibration is a list of preprocessed batches, needed by the int8 variant.
+def export(names, directory=EXPORT_DIR, paths=MODEL_PATHS, variant='float32', calibration=None):
+    os.makedirs(directory, exist_ok=True)
+    manifest = read_manifest(directory)
+    engine = KerasEngine(paths)
+    suffix = '' if variant == 'float32' else f'_{variant}'
+
+    for name in names:
+        loaded = engine.load(name)
+        backbone_file = f'backbone_{loaded.fingerprint[:12]}{suffix}.tflite'
+        head_file = f'{name}_head{suffix}.tflite'
+
+        backbone_dataset = head_dataset = None
+        if calibration is not None:
+            # The head is calibrated with the features of the same images
+            embeddings = np.concatenate([loaded.backbone(batch) for batch in calibration])
+            backbone_dataset = lambda: ([image[np.newaxis].astype(np.float32)] for batch in calibration for image in batch)
+            head_dataset = lambda: ([embedding[np.newaxis].astype(np.float32)] for embedding in embeddings)
+
+        # Models with the same backbone reuse the converted file
+        if not os.path.exists(os.path.join(directory, backbone_file)):
+            write_model(directory, backbone_file, convert(engine.backbone_models[loaded.fingerprint], backbone_dataset))
+        write_model(directory, head_file, convert(engine.head_models[name], head_dataset))
+
+        entry = manifest['models'].setdefault(name, {'files': {}})
+        entry['source'] = os.path.abspath(paths[name])
+        entry['backbone_fingerprint'] = loaded.fingerprint
+        entry['head_fingerprint'] = loaded.head_fingerprint
+        entry['files'][variant] = {'backbone': backbone_file, 'head': head_file}
+        print(f'{name}: {backbone_file}, {head_file}')
+
+    write_manifest(directory, manifest)
+    return manifest
+
+# Load sample images for the checks, or random images if there are none
+def sample_images(images_dir=None, count=16, segment=True, seed=42):
+    if images_dir:
+        from batch_classify import collect_paths
+
+        paths = collect_paths([images_dir])[:count]
+        loaded = [load_stage(path, segment)[1] for path in paths]
+        images = [image for image in loaded if not isinstance(image, Exception)]
+        if images:
+            return preprocess_batch(np.stack(images))
+
+    random = np.random.default_rng(seed)
+    images = random.integers(0, 256, size=(count, IMAGE_SIZE, IMAGE_SIZE, 3), dtype=np.uint8)
+    return preprocess_batch(images)
+
+# Compare the predicted class and the probabilities of two engines on the same images
+def check_parity(reference, candidate, images, names, tolerance=DEFAULT_TOLERANCE):
+    report = {}
+    for name in names:
+        expected = reference.predict(name, images)
+        predicted = candidate.predict(name, images)
+        same_class = np.mean(np.argmax(expected, axis=1) == np.argmax(predicted, axis=1))
+        max_difference = float(np.max(np.abs(expected - predicted)))
+        report[name] = {
+            'same_class': float(same_class),
+            'max_abs_difference': max_difference,
+            'ok': bool(same_class == 1.0 and max_difference <= tolerance),
+        }
+    return report
+
+# Print the parity report, returning if every model passed
+def print_parity(report, label):
+    for name, result in report.items():
+        status = 'OK' if result['ok'] else 'FAILED'
+        print(f'{label} {name}: {status}, same class in {round(result["same_class"] * 100, 2)}% '
+              f'of the images, max difference {result["max_abs_difference"]:.2e}')
+    return all(result['ok'] for result in report.values())
+
+# Read the command line options
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Convert the classifiers to TFLite and check them against Keras.')
+    parser.add_argument('--models', nargs='+', choices=list(CLASS_NAMES), default=list(CLASS_NAMES))
+    parser.add_argument('--output', default=EXPORT_DIR, help='directory of the converted models')
+    parser.add_argument('--images', default=None, help='images used in the parity check, random ones if not given')
+    parser.add_argument('--samples', type=int, default=16)
+    parser.add_argument('--no-segment', action='store_true', help='the check images are already segmented')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument('--check-only', action='store_true', help='only compare the models already exported')
+    return parser.parse_args(argv)
+
+# Main function
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.check_only:
+        export(args.models, args.output)
+
+    images = sample_images(args.images, args.samples, not args.no_segment)
+    reference = ModelRegistry(cache=EmbeddingCache(max_bytes=0))
+    candidate = ModelRegistry(cache=EmbeddingCache(max_bytes=0), engine='tflite', export_dir=args.output)
+    report = check_parity(reference, candidate, images, args.models, args.tolerance)
+    return 0 if print_parity(report, 'tflite') else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,118 @@
+# Daniel Vitor de Oliveira Santos, 716417, Ciência da Computação Coração Eucarístico
+# Guilherme Cosso Lima Pimenta, gclpimenta@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+# Larissa Kaweski Siqueira, larissa.kaweski@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+import cv2
+import numpy as np
+
+from qimage_bridge import array_to_qpixmap
+from processing_stack import ProcessingStack, freeze, segmentation_steps, step, to_8bit, white_level, window_lut
+
+# Read a grayscale image keeping its bit depth (8 or 16 bits), also from paths with non ASCII characters
+def read_image(path):
+    image = cv2.imdecode(np.fromfile(path, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+    if image is None:
+        raise ValueError(f'could not read the image {path}')
+    if image.dtype not in (np.uint8, np.uint16):
+        raise ValueError(f'images of type {image.dtype} are not supported: {path}')
+    if image.ndim == 3 and image.shape[2] == 1:
+        image = image[:, :, 0]
+    elif image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGRA2GRAY if image.shape[2] == 4 else cv2.COLOR_BGR2GRAY)
+    return image
+
+# Image open in the window: the decoded pixels are the source of truth
+#
+# The master is the image as read from the file, at 8 or 16 bits, and current
+# is the output of the processing stack applied to it. Both are read-only numpy
+# arrays, the operations make new arrays, so they can be given to the
+# classification thread as they are. Buffers derived from the current image
+# (its 8-bit version, the pixmap shown, the preview buffer) are kept until the
+# current image changes, and the pixmap is only made to be shown, never read back.
+class ImageDocument:
+    def __init__(self, master=None, path=None):
+        self.path = path
+        self.master = freeze(master) if master is not None else None
+        self.white = white_level(self.master) if master is not None else 255
+        self.stack = ProcessingStack(self.master)
+        self.current = self.master
+        self.version = 0
+        self.derived = {}
+
+    # Open an image file
+    @classmethod
+    def load(cls, path):
+        return cls(read_image(path), path)
+
+    def is_empty(self):
+        return self.current is None
+
+    # White level of an image of the stack, the windowing gives 8-bit images
+    def white_of(self, image):
+        return 255 if image.dtype == np.uint8 else self.white
+
+    # Show the output of the stack, forgetting the buffers derived from the old image
+    def refresh(self):
+        self.current = self.stack.output()
+        self.version += 1
+        self.derived = {}
+
+    # Segment the current image
+    def segment(self):
+        self.stack.push(*segmentation_steps(self.current, len(self.stack.steps), self.white_of(self.current)))
+        self.refresh()
+
+    # Window the current image, a new windowing replaces the last one instead of clipping it again
+    def window(self, low, high):
+        white = self.white_of(self.stack.below('window_level'))
+        self.stack.push_or_replace(step('window_level', low=low, high=high, white=white))
+        self.refresh()
+
+    # Go back to the image as read from the file, can be undone
+    def reset(self):
+        self.stack.clear()
+        self.refresh()
+
+    # Undo the last change, False if there is nothing to undo
+    def undo(self):
+        if not self.stack.undo():
+            return False
+        self.refresh()
+        return True
+
+    # Redo the last change undone, False if there is nothing to redo
+    def redo(self):
+        if not self.stack.redo():
+            return False
+        self.refresh()
+        return True
+
+    # 8-bit version of the current image, for the screen and the models
+    #
+    # 16-bit images are scaled over their whole range, the 8-bit ones are used as they are.
+    def gray8(self):
+        if self.current.dtype == np.uint8:
+            return self.current
+        if 'gray8' not in self.derived:
+            self.derived['gray8'] = freeze(to_8bit(self.current, self.white))
+        return self.derived['gray8']
+
+    # Pixmap of the current image, to give to PhotoViewer.setPhoto
+    def pixmap(self):
+        if 'pixmap' not in self.derived:
+            self.derived['pixmap'] = array_to_qpixmap(self.gray8())
+        return self.derived['pixmap']
+
+    # Pixmap of the image below the last windowing with the windowing [low, high], without changing the document
+    #
+    # A 16-bit image is scaled to 8 bits once, then each tick is a 256 entry
+    # cv2.LUT into an 8-bit buffer reused while the current image is the same,
+    # so moving a slider costs the same for 8 and 16-bit images and does not
+    # allocate an image each time.
+    def preview(self, low, high):
+        if 'preview' not in self.derived:
+            image = self.stack.below('window_level')
+            self.derived['preview_source'] = to_8bit(image, self.white_of(image))
+            self.derived['preview'] = np.empty(image.shape, dtype=np.uint8)
+        buffer = self.derived['preview']
+        cv2.LUT(self.derived['preview_source'], window_lut(low, high), dst=buffer)
+        return array_to_qpixmap(buffer)
@@ -3,18 +3,22 @@
 # Larissa Kaweski Siqueira, larissa.kaweski@sga.pucminas.br, Ciência da Computação Coração Eucarístico
 import sys
 import time
-from PyQt5.QtWidgets import QMainWindow, QApplication, QPushButton, QLabel, QFileDialog, QWidget
-from PyQt5.QtCore import pyqtSlot, QFile, QTextStream
+import argparse
+from PyQt5.QtWidgets import QMainWindow, QApplication, QPushButton, QLabel, QFileDialog, QWidget, QShortcut
+from PyQt5.QtCore import pyqtSlot, QFile, QTextStream, QTimer
 from pathlib import Path
-from PyQt5.QtGui import QPixmap, QImage, QIcon
+from PyQt5.QtGui import QPixmap, QImage, QIcon, QKeySequence
 from PyQt5 import QtCore, QtGui, QtWidgets, uic
 import cv2
 import numpy as np
-from PIL import Image, ImageQt
-from tensorflow.keras.models import load_model
-from tensorflow.keras.applications.resnet50 import preprocess_input
 
 from sidebar_ui import Ui_MainWindow
+from workers import LatestRequestRunner
+from models import ModelRegistry, prepare_image, preprocess_batch, decode_prediction
+import segmentation
+from image_document import ImageDocument
+from embedding_cache import EmbeddingCache
+from engines import ENGINES
 
 class PhotoViewer(QtWidgets.QGraphicsView):
     photoClicked = QtCore.pyqtSignal(QtCore.QPoint)
@@ -65,6 +69,11 @@ class PhotoViewer(QtWidgets.QGraphicsView):
             self._photo.setPixmap(QtGui.QPixmap())
         self.fitInView()
 
+    # Change the pixels shown, keeping the zoom and position
+    def updatePhoto(self, pixmap):
+        if self.hasPhoto():
+            self._photo.setPixmap(pixmap)
+
     def wheelEvent(self, event):
         if self.hasPhoto():
             if event.angleDelta().y() > 0:
@@ -92,11 +101,12 @@ class PhotoViewer(QtWidgets.QGraphicsView):
         super(PhotoViewer, self).mousePressEvent(event)
 
 class MainWindow(QMainWindow):
-    def __init__(self):
+    def __init__(self, cache_dir=None, engine='keras'):
         # Set configuration for main window
         super(MainWindow, self).__init__()
-        self.model_classify_binary = load_model('../train_model/model_weights/best_segmented_2_classes.hdf5')
-        self.model_classify_multiclass = load_model('../train_model/model_weights/best_segmented_4_classes.hdf5')
+        
+        # Models are loaded the first time they are used, results are cached per image
+        self.models = ModelRegistry(cache=EmbeddingCache(directory=cache_dir), engine=engine)
         self.previsao = "0"
         self.precisao = "0"
         self.tempo = "0"
@@ -128,6 +138,12 @@ class MainWindow(QMainWindow):
         self.value_min = 0
         self.value_max = 128
         
+        # Preview the windowing while the sliders move, at most once per frame (60 Hz)
+        self.preview_timer = QTimer(self)
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.setInterval(16)
+        self.preview_timer.timeout.connect(self.show_window_preview)
+        
         # Set values
         self.ui.label_min.setText(str(0))
         self.ui.label_max.setText(str(128))
@@ -135,9 +151,13 @@ class MainWindow(QMainWindow):
         self.ui.precision.setText(self.precisao)
         self.ui.f1score.setText(self.tempo)
         
-        # Create main pixelmap and original image
-        self.pixmap = None
-        self.original_image = None
+        # Run classification outside the GUI thread, keeping only the last click
+        self.classification_runner = LatestRequestRunner(self)
+        self.classification_runner.finished.connect(self.show_classification)
+        self.classification_runner.failed.connect(self.show_classification_error)
+        
+        # Image open in the window, kept as an array, the viewer only gets its pixmap
+        self.document = ImageDocument()
         
         # Reset image to original
         self.ui.reset_image.clicked.connect(self.apply_reset_image)
@@ -153,226 +173,195 @@ class MainWindow(QMainWindow):
         
         # Apply classification multiclass
         self.ui.classification_2.clicked.connect(self.apply_classification_multiclass)
+        
+        # Undo and redo the operations, the images of each state are kept
+        QShortcut(QKeySequence('Ctrl+Z'), self, activated=self.apply_undo)
+        QShortcut(QKeySequence('Ctrl+Y'), self, activated=self.apply_redo)
     
     # Function to open image
     def open_image(self):
         downloads_path = str(Path.home() / "Downloads")
-        fname = QFileDialog.getOpenFileName(self, 'Open File', f'''{downloads_path}''', "Image Files (*.png *.tiff *.jpg)")
-        self.pixmap = QPixmap(fname[0])
-        self.original_image = self.pixmap
-        self.viewer.setPhoto(self.pixmap)
+        fname = QFileDialog.getOpenFileName(self, 'Open File', f'''{downloads_path}''', "Image Files (*.png *.tiff *.tif *.jpg)")
+        if not fname[0]:
+            return
+        self.cancel_classification()
+        try:
+            self.document = ImageDocument.load(fname[0])
+        except ValueError as error:
+            print(error, file=sys.stderr)
+            self.document = ImageDocument()
+            self.viewer.setPhoto(None)
+            return
+        self.viewer.setPhoto(self.document.pixmap())
     
     # Reset image to initial config
     def apply_reset_image(self):
-        self.pixmap = self.original_image
-        self.viewer.setPhoto(self.pixmap)
-        self.ui.accuracy.setText(self.previsao)
-        self.ui.precision.setText(self.precisao)
-        self.ui.f1score.setText(self.tempo)
+        self.cancel_classification()
+        if not self.document.is_empty():
+            self.document.reset()
+            self.viewer.setPhoto(self.document.pixmap())
         self.ui.horizontalSlider_min.setValue(0)
         self.ui.horizontalSlider_max.setValue(128)
         self.ui.label_min.setText(str(0))
         self.ui.label_max.setText(str(128))
+        self.preview_timer.stop()
         
     # Crop the image
     def crop_image(self, image):
-        # Get the dimensions of the image
-        height, width = image.shape[:2]
-
-        # Define the coordinates of the region of interest (ROI)
-        x = 15
-        y = 15
-        crop_width = width - 30
-        crop_height = height - 30
-        
-        return image[y:y+crop_height, x:x+crop_width]
+        return segmentation.crop_image(image)
 
     # Find the optimal gamma for the image
     def find_optimal_gamma(self, image):
-        # Calculate average of pixels
-        mean = np.mean(image)
-
-        # Return the optimal gamma number for this image
-        return np.log(mean) / np.log(512)
+        return segmentation.find_optimal_gamma(image)
 
     # Identify the largest object in the image
     def biggest_object(self, image):
-        # Perform labeling of connected components
-        num_labels, labels, stats, centroids = cv2.connectedComponentsWithStats(image)
-
-        # Find the index of the largest object (excluding the background)
-        largest_label = np.argmax(stats[1:, cv2.CC_STAT_AREA]) + 1
-
-        # Create a mask only for the largest object
-        return np.uint8(labels == largest_label) * 255
+        return segmentation.biggest_object(image)
 
     # Segment a image
     def segment_image(self, image):
-        # Crop image, removing 15 pixels from the edges
-        cropped = self.crop_image(image)
-        
-        # Set the ideal gamma
-        gamma = self.find_optimal_gamma(image)
- 
-        # Apply gamma and Otsu transformation if necessary, otherwise apply only Threhold Binary
-        if gamma >= 0.6:
-            gamma_corrected = np.power(cropped / 255.0, gamma)
-            image_filtered = np.uint8(gamma_corrected * 255)
-            _, result = cv2.threshold(image_filtered, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-        else:
-            image_filtered = cropped
-            _, result = cv2.threshold(image_filtered, 1, maxval=255, type=cv2.THRESH_BINARY)
-            
-        # Largest object in the image (breast)
-        image_biggest = self.biggest_object(result)
-        
-        # Match the mask of the largest object with the original cropped image
-        return cv2.bitwise_and(cropped, cropped, mask=image_biggest)
-    
-    # Convert qpixmap to array
-    def qpixmap_to_nparray(self, qpixmap):
-        # Convert QPixmap to QImage
-        qimage = qpixmap.toImage()
-
-        # Convert QImage to PIL Image
-        image = Image.fromqpixmap(qimage)
-
-        # Convert PIL Image to NumPy array
-        return np.array(image)
-    
-    # Convert array to pixmap
-    def nparray_to_qpixmap(self, image):
-        # Convert the NumPy array to a QImage
-        height, width = image.shape
-        qimage = QImage(image.data, width, height, width, QImage.Format_Grayscale8)
-
-        # Convert the QImage to a QPixmap
-        return QPixmap.fromImage(qimage)
-    
-    # array to cvimage
-    def nparray_to_cvimage(self, np_array):
-        # Convert NumPy array to OpenCV image
-        return cv2.cvtColor(np_array, cv2.COLOR_RGB2GRAY)
+        return segmentation.segment_image(image)
     
     # Apply segmentation, if exist a image
     def apply_segmentation(self):
-        if self.pixmap != None:
-            np_array = self.qpixmap_to_nparray(self.pixmap)
-            image = self.nparray_to_cvimage(np_array)
-            segmented_image = self.segment_image(image)
-            pixmap_segmented = self.nparray_to_qpixmap(segmented_image)
-            self.pixmap = pixmap_segmented
-            self.viewer.setPhoto(self.pixmap)
+        if not self.document.is_empty():
+            self.cancel_classification()
+            self.document.segment()
+            self.viewer.setPhoto(self.document.pixmap())
     
     # Apply windowing, if exist a image
     def apply_windowing(self):
-        if self.pixmap != None:
-            image = self.pixmap
-            pixmap_window = self.apply_window_level(image)
-            self.pixmap = pixmap_window
-            self.viewer.setPhoto(self.pixmap)      
+        if not self.document.is_empty():
+            self.cancel_classification()
+            self.document.window(*self.window_limits())
+            self.viewer.setPhoto(self.document.pixmap())
+    
+    # Undo the last operation, if exist a image
+    def apply_undo(self):
+        if not self.document.is_empty() and self.document.undo():
+            self.cancel_classification()
+            self.viewer.setPhoto(self.document.pixmap())
+    
+    # Redo the last operation undone, if exist a image
+    def apply_redo(self):
+        if not self.document.is_empty() and self.document.redo():
+            self.cancel_classification()
+            self.viewer.setPhoto(self.document.pixmap())
     
     # Change min value of windowing
     def number_change_min(self):
-        if self.pixmap != None:
+        if not self.document.is_empty():
             new_value_min = str(self.ui.horizontalSlider_min.value())
             self.ui.label_min.setText(new_value_min)
             self.value_min = new_value_min
+            self.schedule_window_preview()
     
     # Change max value of windowing
     def number_change_max(self):
-        if self.pixmap != None:
+        if not self.document.is_empty():
             new_value_max = str(self.ui.horizontalSlider_max.value())
             self.ui.label_max.setText(new_value_max)
             self.value_max = new_value_max
+            self.schedule_window_preview()
     
-    # Use binary classifier
-    def classify_binary(self, image):
-        image = cv2.resize(image, (224, 224))
-        image_rgb = cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)  # Converter imagem em escala de cinza para RGB
-        image_rgb = np.expand_dims(image_rgb, axis=0)
-        image_rgb = preprocess_input(image_rgb)
+    # Show the preview on the next frame, the ticks in between only move the limits
+    def schedule_window_preview(self):
+        if not self.preview_timer.isActive():
+            self.preview_timer.start()
+    
+    # Show the image with the windowing of the sliders, the windowing button applies it
+    def show_window_preview(self):
+        if not self.document.is_empty():
+            self.viewer.updatePhoto(self.document.preview(*self.window_limits()))
+    
+    # Use a classifier on a grayscale image
+    def classify(self, name, image):
+        image_rgb = np.expand_dims(prepare_image(image), axis=0)
+        image_rgb = preprocess_batch(image_rgb)
+        self.models.get(name)
         
         start_time = time.time()  # Registrar o tempo inicial
-        prediction = self.model_classify_binary.predict(image_rgb)
+        prediction = self.models.predict(name, image_rgb)
         end_time = time.time()  # Registrar o tempo final
         elapsed_time = end_time - start_time  # Calcular o tempo decorrido
     
-        class_names = ['I', 'III']
-        predicted_class = np.argmax(prediction[0])
-        predicted_label = class_names[predicted_class]
-        accuracy = prediction[0][predicted_class]
-        
-        self.ui.accuracy.setText(predicted_label)
-        self.ui.precision.setText(str(f'{round(accuracy * 100, 2)}%'))
-        self.ui.f1score.setText(str(f'{round(elapsed_time, 2)}s'))
+        predicted_label, accuracy = decode_prediction(name, prediction[0])
+        return predicted_label, accuracy, elapsed_time
+    
+    # Use binary classifier
+    def classify_binary(self, image):
+        return self.classify('binary', image)
     
     # Use multiclass classifier
     def classify_multiclass(self, image):
-        image = cv2.resize(image, (224, 224))
-        image_rgb = cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)  # Converter imagem em escala de cinza para RGB
-        image_rgb = np.expand_dims(image_rgb, axis=0)
-        image_rgb = preprocess_input(image_rgb)
-        
-        start_time = time.time()  # Registrar o tempo inicial
-        prediction = self.model_classify_multiclass.predict(image_rgb)
-        end_time = time.time()  # Registrar o tempo final
-        elapsed_time = end_time - start_time  # Calcular o tempo decorrido
+        return self.classify('multiclass', image)
     
-        class_names = ['I', 'II', 'III', 'IV']
-        predicted_class = np.argmax(prediction[0])
-        predicted_label = class_names[predicted_class]
-        accuracy = prediction[0][predicted_class]
-        
+    # Show the result sent back by the classification worker
+    def show_classification(self, result):
+        predicted_label, accuracy, elapsed_time = result
         self.ui.accuracy.setText(predicted_label)
         self.ui.precision.setText(str(f'{round(accuracy * 100, 2)}%'))
         self.ui.f1score.setText(str(f'{round(elapsed_time, 2)}s'))
     
+    # Show that the classification failed, keeping the window usable
+    def show_classification_error(self, message):
+        print(message, file=sys.stderr)
+        self.ui.accuracy.setText("Erro")
+        self.ui.precision.setText(self.precisao)
+        self.ui.f1score.setText(self.tempo)
+    
+    # Forget the classification, it was of another image
+    def cancel_classification(self):
+        self.classification_runner.cancel()
+        self.ui.accuracy.setText(self.previsao)
+        self.ui.precision.setText(self.precisao)
+        self.ui.f1score.setText(self.tempo)
+    
+    # Show that a classification is running
+    def show_classification_pending(self):
+        self.ui.accuracy.setText("...")
+        self.ui.precision.setText("...")
+        self.ui.f1score.setText("...")
+    
     # Apply binary model
     def apply_classification_binary(self):
-        if self.pixmap != None:
-            np_array = self.qpixmap_to_nparray(self.pixmap)
-            image = self.nparray_to_cvimage(np_array)
-            self.classify_binary(image)
+        if not self.document.is_empty():
+            # The 8-bit array of the document is read-only, so the worker can use it without a copy
+            self.show_classification_pending()
+            self.classification_runner.submit(self.classify_binary, self.document.gray8())
     
     # Apply multiclass model    
     def apply_classification_multiclass(self):
-        if self.pixmap != None:
-            np_array = self.qpixmap_to_nparray(self.pixmap)
-            image = self.nparray_to_cvimage(np_array)
-            self.classify_multiclass(image)
+        if not self.document.is_empty():
+            # The 8-bit array of the document is read-only, so the worker can use it without a copy
+            self.show_classification_pending()
+            self.classification_runner.submit(self.classify_multiclass, self.document.gray8())
+    
+    # Wait for the classification thread before closing
+    def closeEvent(self, event):
+        self.classification_runner.shutdown()
+        super(MainWindow, self).closeEvent(event)
     
-    # Change image to windowing
-    def apply_window_level(self, pixmap):
+    # Limits of the windowing chosen in the sliders
+    def window_limits(self):
         minV = round(self.ui.horizontalSlider_min.value() / 2)
         maxV = round(128 + self.ui.horizontalSlider_max.value() / 2 )
-        # Convert the QImage to a numpy array
-        qImage = pixmap.toImage()
-        QImgem2 = qImage
-
-        # Convert the QImage to a numpy array
-        w, h = qImage.width(), qImage.height()
-        data = qImage.bits().asarray(w * h * 4)
-        arr = np.asarray(data).reshape(h, w, 4)
-        # Convert the array to an image object using the Pillow library
-        adjusted_image = np.clip(arr, minV, maxV)
-
-        img = Image.fromarray(adjusted_image)
-
-        # Convert the Pillow image to a QImage
-        qimg = ImageQt.toqimage(img)
-
-        # Check if the conversion was successful
-        if not qimg.isNull():
-            pixmap = QPixmap.fromImage(qimg)
-        else:
-            pixmap = QPixmap.fromImage(QImgem2)
-        return pixmap
+        return minV, maxV
         
 # Main function
 def main():
+    # Read the application options, leaving the Qt ones untouched
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--preload', nargs='*', default=[], choices=['binary', 'multiclass'],
+                        help='models loaded in background right after the window is shown')
+    parser.add_argument('--cache-dir', default=None,
+                        help='directory to keep the classification results between sessions')
+    parser.add_argument('--engine', choices=ENGINES, default='keras',
+                        help='runtime of the models, tflite needs export_models.py to be run first')
+    args, qt_args = parser.parse_known_args()
+    
     # Start Application
-    app = QApplication(sys.argv)
+    app = QApplication(sys.argv[:1] + qt_args)
     
     # Load Style
     style_file = QFile("style/style.qss")
@@ -381,13 +370,34 @@ def main():
     app.setStyleSheet(style_stream.readAll())
     
     # Call main window
-    window = MainWindow()
+    window = MainWindow(cache_dir=args.cache_dir, engine=args.engine)
     window.setWindowTitle("Segmentação e Classificação de Imagens Mamográficas")
     window.setWindowIcon(QIcon('raiox.jpg'))
     window.show()
     
+    # Load and warm up the chosen models without blocking the window
+    if args.preload:
+        window.models.preload(args.preload)
+    
     # If exit application
     sys.exit(app.exec())
 
+# Batch function, classify images from the command line without the window
+# Usage: python main.py batch <images or directories> -o results.csv
+def main_batch():
+    import batch_classify
+    sys.exit(batch_classify.main(sys.argv[2:]))
+
+# Server function, answer classification requests over HTTP without the window
+# Usage: python main.py serve --port 8000
+def main_serve():
+    import server
+    sys.exit(server.main(sys.argv[2:]))
+
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    if len(sys.argv) > 1 and sys.argv[1] == 'batch':
+        main_batch()
+    elif len(sys.argv) > 1 and sys.argv[1] == 'serve':
+        main_serve()
+    else:
+        main()
\ No newline at end of file
@@ -0,0 +1,59 @@
+# Daniel Vitor de Oliveira Santos, 716417, Ciência da Computação Coração Eucarístico
+# Guilherme Cosso Lima Pimenta, gclpimenta@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+# Larissa Kaweski Siqueira, larissa.kaweski@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+import numpy as np
+
+# Count the predictions of each true class (rows) as each class (columns)
+def confusion_matrix(true_labels, predicted_labels, num_classes):
+    true_labels = np.asarray(true_labels, dtype=np.int64)
+    predicted_labels = np.asarray(predicted_labels, dtype=np.int64)
+    counts = np.bincount(true_labels * num_classes + predicted_labels, minlength=num_classes * num_classes)
+    return counts.reshape(num_classes, num_classes)
+
+# Divide ignoring the classes without samples, like sklearn with zero_division=0
+def safe_divide(numerator, denominator):
+    numerator = np.asarray(numerator, dtype=np.float64)
+    denominator = np.asarray(denominator, dtype=np.float64)
+    return np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator > 0)
+
+# Specificity of each class, TN / (TN + FP), without removing rows and columns one class at a time
+def specificity_per_class(confusion_mat):
+    true_positive = np.diag(confusion_mat)
+    false_positive = confusion_mat.sum(axis=0) - true_positive
+    false_negative = confusion_mat.sum(axis=1) - true_positive
+    true_negative = confusion_mat.sum() - true_positive - false_positive - false_negative
+    return safe_divide(true_negative, true_negative + false_positive)
+
+# Metrics printed by the evaluation cell of the notebooks
+#
+# Precision, recall and F1 are weighted by the number of samples of each class,
+# as precision_score(..., average='weighted') does, and the specificity is the
+# mean of the specificity of each class.
+def compute_metrics(true_labels, predicted_labels, num_classes):
+    confusion_mat = confusion_matrix(true_labels, predicted_labels, num_classes)
+    true_positive = np.diag(confusion_mat)
+    support = confusion_mat.sum(axis=1)
+
+    precision = safe_divide(true_positive, confusion_mat.sum(axis=0))
+    recall = safe_divide(true_positive, support)
+    f1 = safe_divide(2 * precision * recall, precision + recall)
+    weights = safe_divide(support, support.sum())
+
+    return {
+        'accuracy': float(safe_divide(true_positive.sum(), confusion_mat.sum())),
+        'precision': float(np.sum(precision * weights)),
+        'recall': float(np.sum(recall * weights)),
+        'specificity': float(np.mean(specificity_per_class(confusion_mat))),
+        'f1': float(np.sum(f1 * weights)),
+        'confusion_matrix': confusion_mat,
+    }
+
+# Text of the metrics, in the same format as the notebooks
+def format_metrics(metrics):
+    return '\n'.join([
+        f"Accuracy: {round(metrics['accuracy'] * 100, 2)}%",
+        f"Precision: {round(metrics['precision'] * 100, 2)}%",
+        f"Recall (Sensibility): {round(metrics['recall'] * 100, 2)}%",
+        f"Mean Specificity: {round(metrics['specificity'] * 100, 2)}%",
+        f"F1-Score: {round(metrics['f1'] * 100, 2)}%",
+    ])
@@ -0,0 +1,186 @@
+# Daniel Vitor de Oliveira Santos, 716417, Ciência da Computação Coração Eucarístico
+# Guilherme Cosso Lima Pimenta, gclpimenta@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+# Larissa Kaweski Siqueira, larissa.kaweski@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+import os
+import threading
+import cv2
+import numpy as np
+
+from embedding_cache import EmbeddingCache, image_key
+from engines import KerasEngine, make_engine
+
+# Folder with the trained models, relative to this file so it works from any directory
+WEIGHTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'train_model', 'model_weights')
+
+# Trained models used by the application
+MODEL_PATHS = {
+    'binary': os.path.join(WEIGHTS_DIR, 'best_segmented_2_classes.hdf5'),
+    'multiclass': os.path.join(WEIGHTS_DIR, 'best_segmented_4_classes.hdf5'),
+}
+
+# Folder with the models converted by export_models.py
+EXPORT_DIR = os.path.join(WEIGHTS_DIR, 'tflite')
+
+# Classes predicted by each model, in the order of the outputs
+CLASS_NAMES = {
+    'binary': ['I', 'III'],
+    'multiclass': ['I', 'II', 'III', 'IV'],
+}
+
+# Input size expected by the ResNet50 models
+IMAGE_SIZE = 224
+
+# Resize a grayscale image to the model input, as RGB uint8
+def prepare_image(image):
+    image = cv2.resize(image, (IMAGE_SIZE, IMAGE_SIZE))
+    return cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)
+
+# Mean of the ImageNet channels (BGR) removed by the ResNet50 preprocessing
+IMAGENET_MEAN_BGR = np.array([103.939, 116.779, 123.68], dtype=np.float32)
+
+# Apply the ResNet50 preprocessing on a batch of prepared images
+def preprocess_batch(images):
+    try:
+        from tensorflow.keras.applications.resnet50 import preprocess_input
+    except ImportError:
+        # Same operation as preprocess_input, for machines with only tflite_runtime
+        return np.asarray(images, dtype=np.float32)[..., ::-1] - IMAGENET_MEAN_BGR
+    return preprocess_input(np.asarray(images))
+
+# Get the label and the probability of the predicted class
+def decode_prediction(name, prediction):
+    predicted_class = np.argmax(prediction)
+    return CLASS_NAMES[name][predicted_class], prediction[predicted_class]
+
+# Load models only when they are needed, sharing the frozen ResNet50 between them
+#
+# Every model was trained as Sequential(ResNet50, head) with the ResNet50 frozen,
+# so the engines split the models into the backbone (224x224x3 -> 2048) and the
+# head (2048 -> softmax). Heads whose backbones have the same weights share a
+# single backbone, which runs only once per image. Embeddings and outputs are
+# cached by a hash of the preprocessed image, so classifying it again is free.
+class ModelRegistry:
+    def __init__(self, paths=MODEL_PATHS, cache=None, engine='keras', export_dir=EXPORT_DIR):
+        self.paths = dict(paths)
+        self.engine = make_engine(engine, self.paths, export_dir)
+
+        # Models already loaded, with the fingerprint of the backbone they use
+        self.models = {}
+
+        # Backbones in memory, by fingerprint
+        self.backbones = {}
+
+        # Embeddings and outputs of the images already classified
+        self.cache = cache if cache is not None else EmbeddingCache()
+
+        # One lock per model, so loading one does not block the other
+        self.locks = {name: threading.Lock() for name in self.paths}
+        self.backbone_lock = threading.Lock()
+
+    # Check if the model is already in memory
+    def is_loaded(self, name):
+        return name in self.models
+
+    # Get a model, loading and warming it up the first time
+    def get(self, name):
+        model = self.models.get(name)
+        if model is not None:
+            return model
+
+        with self.locks[name]:
+            # Another thread may have loaded it while we were waiting
+            if name not in self.models:
+                model = self.engine.load(name)
+                with self.backbone_lock:
+                    self.backbones.setdefault(model.fingerprint, model.backbone)
+                self.warm_up(model)
+                self.models[name] = model
+        return self.models[name]
+
+    # Run one dummy prediction, so the graph is traced before the first real image
+    def warm_up(self, model):
+        dummy = np.zeros((1, IMAGE_SIZE, IMAGE_SIZE, 3), dtype=np.float32)
+        model.head(self.backbones[model.fingerprint](dummy))
+
+    # Compute the 2048 features of preprocessed images, reusing the cached ones
+    def embed(self, fingerprint, batch):
+        keys = [image_key(fingerprint, image) for image in batch]
+        embeddings = [None] * len(batch)
+        for i, key in enumerate(keys):
+            entry = self.cache.get(key)
+            if entry is not None and entry.embedding is not None:
+                embeddings[i] = entry.embedding
+
+        # Run the backbone only on the images not in the cache
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            computed = self.backbones[fingerprint](batch[missing])
+            # Copy each row, a view would keep the whole batch alive in the cache
+            for i, embedding in zip(missing, computed):
+                embeddings[i] = embedding.copy()
+                self.cache.put(keys[i], embedding=embeddings[i])
+
+        return np.stack(embeddings)
+
+    # Compute the probabilities of a model for preprocessed images
+    def predict(self, name, batch):
+        model = self.get(name)
+        keys = [image_key(model.fingerprint, image) for image in batch]
+        outputs = [None] * len(batch)
+        for i, key in enumerate(keys):
+            entry = self.cache.get(key)
+            if entry is not None and model.head_fingerprint in entry.outputs:
+                outputs[i] = entry.outputs[model.head_fingerprint]
+
+        # Run the head only on the images without a cached output
+        missing = [i for i, output in enumerate(outputs) if output is None]
+        if missing:
+            computed = model.head(self.embed(model.fingerprint, batch[missing]))
+            for i, output in zip(missing, computed):
+                outputs[i] = output.copy()
+                self.cache.put(keys[i], outputs={model.head_fingerprint: outputs[i]})
+
+        return np.stack(outputs)
+
+    # Compute the probabilities of several models with a single backbone pass
+    def predict_all(self, batch, names=None):
+        return {name: self.predict(name, batch) for name in (names or self.paths)}
+
+    # Build a single Keras model with one backbone feeding the heads
+    def combined_model(self, names=None):
+        import tensorflow as tf
+
+        if not isinstance(self.engine, KerasEngine):
+            raise ValueError('the combined model is only available with the keras engine')
+        names = list(names or self.paths)
+        fingerprints = {self.get(name).fingerprint for name in names}
+        if len(fingerprints) != 1:
+            raise ValueError('the models do not share the same backbone')
+
+        inputs = tf.keras.Input(shape=(IMAGE_SIZE, IMAGE_SIZE, 3))
+        embedding = self.engine.backbone_models[fingerprints.pop()](inputs, training=False)
+        outputs = {name: self.engine.head_models[name](embedding, training=False) for name in names}
+        return tf.keras.Model(inputs, outputs, name='combined')
+
+    # Load models in a background thread
+    def preload(self, names):
+        thread = threading.Thread(target=self._preload, args=(list(names),), daemon=True)
+        thread.start()
+        return thread
+
+    def _preload(self, names):
+        for name in names:
+            self.get(name)
+
+    # Remove a model from memory, and its backbone if no other model uses it
+    def unload(self, name):
+        with self.locks[name]:
+            model = self.models.pop(name, None)
+        if model is None:
+            return
+        with self.backbone_lock:
+            if all(other.fingerprint != model.fingerprint for other in self.models.values()):
+                self.backbones.pop(model.fingerprint, None)
+                self.engine.release(name, model.fingerprint)
+            else:
+                self.engine.release(name)
@@ -0,0 +1,186 @@
+# Daniel Vitor de Oliveira Santos, 716417, Ciência da Computação Coração Eucarístico
+# Guilherme Cosso Lima Pimenta, gclpimenta@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+# Larissa Kaweski Siqueira, larissa.kaweski@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+import os
+import time
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+import numpy as np
+
+from models import prepare_image
+from segmentation import segment_image, set_gamma_precision, set_mask_scale
+from processing_stack import to_8bit, white_level
+
+# Marks the end of the images in the queue
+END = None
+
+# Decode an 8-bit grayscale image for the models
+#
+# 16-bit images are decoded at 16 bits and scaled to 8 bits over the bits they
+# use (cv2.convertScaleAbs), instead of keeping only their high byte
+# (which leaves 12-bit mammograms almost black). None if the data is not an image.
+def decode_image(data):
+    image = cv2.imdecode(data, cv2.IMREAD_GRAYSCALE | cv2.IMREAD_ANYDEPTH)
+    if image is not None and image.dtype == np.uint16:
+        return to_8bit(image, white_level(image))
+    if image is not None and image.dtype != np.uint8:
+        return cv2.imdecode(data, cv2.IMREAD_GRAYSCALE)
+    return image
+
+# Read a grayscale image, also from paths with non ASCII characters
+def read_image(path):
+    image = decode_image(np.fromfile(path, dtype=np.uint8))
+    if image is None:
+        raise ValueError(f'could not read the image {path}')
+    return image
+
+# Configure the segmentation of a pool process
+def init_worker(gamma_precision=None, mask_scale=1):
+    set_gamma_precision(gamma_precision)
+    set_mask_scale(mask_scale)
+
+# Decode, segment and resize an image, measuring each stage (runs in the process pool)
+def load_stage(path, segment=True):
+    timings = {}
+    try:
+        start_time = time.perf_counter()
+        image = read_image(path)
+        timings['decode'] = time.perf_counter() - start_time
+
+        if segment:
+            start_time = time.perf_counter()
+            image = segment_image(image)
+            timings['segment'] = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        image = prepare_image(image)
+        timings['resize'] = time.perf_counter() - start_time
+    except Exception as error:
+        return path, error, timings
+    return path, image, timings
+
+# Number of images and time spent in a stage
+class StageCounter:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def add(self, seconds, count=1):
+        self.count += count
+        self.seconds += seconds
+
+    # Images per second of a single worker in this stage
+    def rate(self):
+        return self.count / self.seconds if self.seconds > 0 else 0.0
+
+# Decode and segment in a process pool while the model runs batches in this process
+#
+# The pool results go through a bounded queue. When the model is slower than the
+# pool the queue fills and the producer stops sending new images (backpressure),
+# so memory stays limited to queue_depth decoded images.
+class StreamingPipeline:
+    def __init__(self, workers=None, queue_depth=64, batch_size=32, segment=True, gamma_precision=None,
+                 mask_scale=1):
+        self.workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        self.queue_depth = queue_depth
+        self.batch_size = batch_size
+        self.segment = segment
+        self.gamma_precision = gamma_precision
+        self.mask_scale = mask_scale
+        self.counters = {name: StageCounter() for name in ('decode', 'segment', 'resize', 'predict')}
+
+        # Time the producer waited for space in the queue, and the consumer for images
+        self.producer_blocked = 0.0
+        self.consumer_starved = 0.0
+        self.elapsed = 0.0
+
+    # Send the images to the pool, blocking when the queue is full
+    def produce(self, paths, pool, results, stop):
+        try:
+            for path in paths:
+                future = pool.submit(load_stage, path, self.segment)
+                start_time = time.perf_counter()
+                while not stop.is_set():
+                    try:
+                        results.put(future, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                self.producer_blocked += time.perf_counter() - start_time
+                if stop.is_set():
+                    return
+        finally:
+            results.put(END)
+
+    # Take the next decoded image from the queue
+    def take(self, results):
+        start_time = time.perf_counter()
+        future = results.get()
+        if future is END:
+            self.consumer_starved += time.perf_counter() - start_time
+            return END
+
+        path, image, timings = future.result()
+        self.consumer_starved += time.perf_counter() - start_time
+        for stage, seconds in timings.items():
+            self.counters[stage].add(seconds)
+        return path, image
+
+    # Run the images through the pipeline, consume receives each batch of (path, image)
+    def run(self, paths, consume):
+        results = queue.Queue(maxsize=self.queue_depth)
+        stop = threading.Event()
+        start_time = time.perf_counter()
+
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker,
+                                 initargs=(self.gamma_precision, self.mask_scale)) as pool:
+            producer = threading.Thread(target=self.produce, args=(paths, pool, results, stop), daemon=True)
+            producer.start()
+            try:
+                batch = []
+                while True:
+                    item = self.take(results)
+                    if item is not END:
+                        batch.append(item)
+                    if batch and (item is END or len(batch) == self.batch_size):
+                        predict_time = time.perf_counter()
+                        rows = consume(batch)
+                        self.counters['predict'].add(time.perf_counter() - predict_time, len(batch))
+                        yield from rows
+                        batch = []
+                    if item is END:
+                        break
+            finally:
+                # Stop the producer if the consumer gave up early
+                stop.set()
+                while producer.is_alive():
+                    try:
+                        results.get_nowait()
+                    except queue.Empty:
+                        producer.join(0.1)
+                self.elapsed = time.perf_counter() - start_time
+
+    # Throughput of each stage
+    def stats(self):
+        stats = {stage: {'images': counter.count, 'seconds': round(counter.seconds, 3),
+                         'images_per_second': round(counter.rate(), 2)}
+                 for stage, counter in self.counters.items()}
+        total = self.counters['predict'].count
+        stats['total'] = {'images': total, 'seconds': round(self.elapsed, 3),
+                          'images_per_second': round(total / self.elapsed, 2) if self.elapsed > 0 else 0.0}
+        stats['producer_blocked_seconds'] = round(self.producer_blocked, 3)
+        stats['consumer_starved_seconds'] = round(self.consumer_starved, 3)
+        return stats
+
+    # Text with the throughput of each stage
+    def report(self):
+        stats = self.stats()
+        lines = [f'{stage}: {stats[stage]["images"]} images, {stats[stage]["images_per_second"]} images/s per worker'
+                 for stage in ('decode', 'segment', 'resize')]
+        lines.append(f'predict: {stats["predict"]["images"]} images, {stats["predict"]["images_per_second"]} images/s')
+        lines.append(f'total: {stats["total"]["images"]} images, {stats["total"]["images_per_second"]} images/s')
+        lines.append(f'producer blocked (backpressure): {stats["producer_blocked_seconds"]}s')
+        lines.append(f'consumer waiting for images: {stats["consumer_starved_seconds"]}s')
+        return '\n'.join(lines)
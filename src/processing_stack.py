@@ -0,0 +1,222 @@
+# Daniel Vitor de Oliveira Santos, 716417, Ciência da Computação Coração Eucarístico
+# Guilherme Cosso Lima Pimenta, gclpimenta@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+# Larissa Kaweski Siqueira, larissa.kaweski@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+import cv2
+import numpy as np
+
+import segmentation
+
+# Make an array read-only, so it can be shared with the workers without copies
+def freeze(image):
+    image.flags.writeable = False
+    return image
+
+# Largest gray level of an image: 255 for 8 bits, 2^bits - 1 for the bits a 16-bit image uses
+def white_level(image):
+    if image.dtype == np.uint8:
+        return 255
+    return (1 << max(8, int(image.max()).bit_length())) - 1
+
+# Scale the gray levels of an image from [0, white] to [0, 255], 8-bit images are returned as they are
+#
+# cv2.convertScaleAbs reads the uint16 pixels and writes the rounded uint8 ones
+# in one multithreaded pass, without a float copy of the image.
+def to_8bit(image, white=255, out=None):
+    if image.dtype == np.uint8:
+        return image
+    return cv2.convertScaleAbs(image, dst=out, alpha=255 / white)
+
+# Lookup table of the windowing, clipping the gray levels to [low, high]
+def window_lut(low, high):
+    return np.clip(np.arange(256), low, high).astype(np.uint8)
+
+# Gamma of segment_image_reference, with the mean of a 16-bit image scaled to 8 bits
+def optimal_gamma(image, white=255):
+    if image.dtype == np.uint8:
+        return float(segmentation.find_optimal_gamma(image))
+    return float(np.log(np.mean(image) * 255 / white) / np.log(512))
+
+# Gamma table of 16-bit images, np.uint16(np.power(p / white, gamma) * white) per gray level
+def gamma_table(value, white):
+    levels = np.minimum(np.arange(65536), white) / white
+    return np.uint16(np.power(levels, value) * white)
+
+# Otsu threshold of a 16-bit image (cv2.threshold only finds it for 8 bits)
+#
+# The histogram comes from cv2.calcHist, which counts the uint16 pixels without
+# converting the image.
+def otsu_level(image):
+    histogram = cv2.calcHist([image], [0], None, [65536], [0, 65536]).ravel().astype(np.float64)
+    weight = np.cumsum(histogram)
+    total = weight[-1]
+    cumulative = np.cumsum(histogram * np.arange(65536))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_below = cumulative / weight
+        mean_above = (cumulative[-1] - cumulative) / (total - weight)
+        variance = weight * (total - weight) * (mean_below - mean_above) ** 2
+    return int(np.argmax(np.nan_to_num(variance)))
+
+# Remove the 15 pixels of the edges, a view of the image
+def crop(image):
+    return segmentation.crop_image(image)
+
+# Gamma correction, through the table of the segmentation for 8-bit images
+def gamma(image, value, white=255):
+    if image.dtype == np.uint8:
+        return cv2.LUT(image, segmentation.default_lut_cache().get(value))
+    return np.take(gamma_table(value, white), image)
+
+# Binary threshold at value, or at the Otsu threshold when value is None, giving a 0/255 uint8 mask
+def threshold(image, value=None):
+    if image.dtype == np.uint8:
+        if value is None:
+            _, result = cv2.threshold(image, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        else:
+            _, result = cv2.threshold(image, value, 255, cv2.THRESH_BINARY)
+        return result
+    if value is None:
+        value = otsu_level(image)
+
+    # The booleans are already one byte per pixel, 0 and 1 become 0 and 255 in place
+    result = np.greater(image, value).view(np.uint8)
+    result *= 255
+    return result
+
+# Mask of the largest object, or the source image inside that mask
+#
+# The connected components and the mask use the buffers of the segmentation
+# engine of the thread, only the result is a new array (it is cached).
+def largest_component(image, source=None):
+    mask = segmentation.default_engine().largest_object(image)
+    if source is None:
+        return mask.copy()
+    return cv2.bitwise_and(source, source, mask=mask)
+
+# Clip the gray levels to [low, high], giving an 8-bit image
+#
+# 16-bit images are scaled to 8 bits first, clipping the rounded levels to the
+# integer limits is the same as rounding the clipped ones.
+def window_level(image, low, high, white=255):
+    return cv2.LUT(to_8bit(image, white), window_lut(low, high))
+
+# Operations of the stack, by name
+OPERATIONS = {
+    'crop': crop,
+    'gamma': gamma,
+    'threshold': threshold,
+    'largest_component': largest_component,
+    'window_level': window_level,
+}
+
+# A step of the stack: the name of the operation and its parameters, hashable
+def step(name, **params):
+    if name not in OPERATIONS:
+        raise ValueError(f'unknown operation {name}, use one of {sorted(OPERATIONS)}')
+    return name, tuple(sorted(params.items()))
+
+# Steps of segment_image_reference, with the gamma of the image they are applied to
+#
+# The source of largest_component is the index of the crop step, so the last
+# step keeps the cropped image inside the mask of the breast. 16-bit images are
+# segmented at 16 bits, with the gamma normalized by their white level and the
+# fixed threshold of 1 scaled to it.
+def segmentation_steps(image, first=0, white=255):
+    value = optimal_gamma(image, white)
+    if value < 0.6:
+        steps = [step('crop'), step('threshold', value=max(1, white // 255))]
+    elif image.dtype == np.uint8:
+        steps = [step('crop'), step('gamma', value=value), step('threshold')]
+    else:
+        steps = [step('crop'), step('gamma', value=value, white=white), step('threshold')]
+    return steps + [step('largest_component', source=first)]
+
+# Ordered operations applied to an image, with the output of every prefix cached
+#
+# The state is a tuple of steps. The output of each prefix of the state is kept
+# in a cache keyed by the prefix, so changing a step only runs the steps after
+# it, and undo and redo only switch to a state whose outputs are cached. The
+# cache keeps the prefixes of the states that can still be reached with undo
+# and redo, at most history states back.
+class ProcessingStack:
+    def __init__(self, image, history=16):
+        self.history = history
+        self.steps = ()
+        self.undo_states = []
+        self.redo_states = []
+        self.outputs = {(): image}
+
+    # Output of the steps (computes only the steps whose prefix is not cached)
+    def run(self, steps):
+        cached = len(steps)
+        while steps[:cached] not in self.outputs:
+            cached -= 1
+        for index in range(cached, len(steps)):
+            name, params = steps[index]
+            kwargs = dict(params)
+            if 'source' in kwargs:
+                kwargs['source'] = self.outputs[steps[:kwargs['source'] + 1]]
+            self.outputs[steps[:index + 1]] = freeze(OPERATIONS[name](self.outputs[steps[:index]], **kwargs))
+        return self.outputs[steps]
+
+    # Output of the current steps
+    def output(self):
+        return self.outputs[self.steps]
+
+    # Output below the last step when it is the operation name, the output otherwise
+    def below(self, name):
+        if self.steps and self.steps[-1][0] == name:
+            return self.outputs[self.steps[:-1]]
+        return self.output()
+
+    # Change to a new state that can be undone
+    def change(self, steps):
+        steps = tuple(steps)
+        if steps == self.steps:
+            return self.output()
+        output = self.run(steps)
+        self.undo_states = (self.undo_states + [self.steps])[-self.history:]
+        self.redo_states = []
+        self.steps = steps
+        self.forget()
+        return output
+
+    # Add steps at the end
+    def push(self, *steps):
+        return self.change(self.steps + steps)
+
+    # Add a step, replacing the last one when it is the same operation (like a new windowing)
+    def push_or_replace(self, new_step):
+        if self.steps and self.steps[-1][0] == new_step[0]:
+            return self.change(self.steps[:-1] + (new_step,))
+        return self.push(new_step)
+
+    # Change the parameters of a step, running again only the steps after it
+    def replace(self, index, new_step):
+        return self.change(self.steps[:index] + (new_step,) + self.steps[index + 1:])
+
+    # Remove every step, going back to the image
+    def clear(self):
+        return self.change(())
+
+    # Go back to the previous state, False if there is none
+    def undo(self):
+        if not self.undo_states:
+            return False
+        self.redo_states.append(self.steps)
+        self.steps = self.undo_states.pop()
+        return True
+
+    # Go forward to the state undone last, False if there is none
+    def redo(self):
+        if not self.redo_states:
+            return False
+        self.undo_states.append(self.steps)
+        self.steps = self.redo_states.pop()
+        return True
+
+    # Forget the outputs that no reachable state uses
+    def forget(self):
+        prefixes = set()
+        for steps in self.undo_states + self.redo_states + [self.steps]:
+            prefixes.update(steps[:index] for index in range(len(steps) + 1))
+        self.outputs = {steps: output for steps, output in self.outputs.items() if steps in prefixes}
@@ -0,0 +1,37 @@
+# Daniel Vitor de Oliveira Santos, 716417, Ciência da Computação Coração Eucarístico
+# Guilherme Cosso Lima Pimenta, gclpimenta@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+# Larissa Kaweski Siqueira, larissa.kaweski@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+import numpy as np
+from PyQt5.QtGui import QImage, QPixmap
+
+try:
+    from PyQt5 import sip
+except ImportError:
+    import sip
+
+# QImage that uses the memory of a height x width uint8 array (Grayscale8), without copying
+#
+# The window only shows 8-bit images: the document scales 16-bit images to 8
+# bits once and keeps that buffer, so there is no Grayscale16 or RGB32 path.
+# Pixels are never read back from a QImage either, the numpy document is the
+# source of truth, so the constBits view the other way was dropped. Only arrays
+# whose rows are not contiguous are copied. The QImage keeps a reference to
+# the array, so the pixels stay valid while the QImage exists. Copies made by
+# Qt share the memory without that reference, use QPixmap.fromImage or
+# QImage.copy to keep the pixels after the array is gone.
+def array_to_qimage(image):
+    if image.ndim != 2 or image.dtype != np.uint8:
+        raise ValueError(f'arrays of shape {image.shape} and type {image.dtype} can not be shown, '
+                         'use a height x width uint8 array')
+
+    # Each row has to be contiguous, the stride between rows can be anything (like a cropped view)
+    if image.strides[1] != 1 or image.strides[0] < image.shape[1]:
+        image = np.ascontiguousarray(image)
+    height, width = image.shape
+    qimage = QImage(sip.voidptr(image.ctypes.data), width, height, image.strides[0], QImage.Format_Grayscale8)
+    qimage.array = image
+    return qimage
+
+# QPixmap of an array, the only copy is the one to the window system
+def array_to_qpixmap(image):
+    return QPixmap.fromImage(array_to_qimage(image))
@@ -0,0 +1,179 @@
+# Daniel Vitor de Oliveira Santos, 716417, Ciência da Computação Coração Eucarístico
+# Guilherme Cosso Lima Pimenta, gclpimenta@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+# Larissa Kaweski Siqueira, larissa.kaweski@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+import os
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+import numpy as np
+
+from models import CLASS_NAMES, EXPORT_DIR, MODEL_PATHS, ModelRegistry, preprocess_batch
+from embedding_cache import EmbeddingCache
+from export_models import export, read_manifest
+from metrics import compute_metrics, format_metrics
+from pipeline import load_stage
+
+# Segmented images written by the training notebooks
+SEGMENTED_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'train_model', 'images_segmented_label')
+
+# Labels of the 4 classes grouped into the 2 classes of the binary model
+BINARY_LABELS = {'I': 'I', 'II': 'I', 'III': 'III', 'IV': 'III'}
+
+# Check if is multiple of 4, the test images of the notebooks
+def is_multiple_of_4(filepath):
+    number = str(filepath).split("(")[-1].split(")")[0]
+    number = number.strip()
+    return number.isdigit() and int(number) % 4 == 0
+
+# Get the segmented images and their labels, split like the notebooks
+def labelled_images(directory=SEGMENTED_DIR):
+    images = [(str(path), path.parent.name) for path in sorted(Path(directory).glob('**/*.png'))]
+    train = [image for image in images if not is_multiple_of_4(image[0])]
+    test = [image for image in images if is_multiple_of_4(image[0])]
+    return train, test
+
+# Label index of an image for a model
+def label_index(name, label):
+    if name == 'binary':
+        label = BINARY_LABELS[label]
+    return CLASS_NAMES[name].index(label)
+
+# Preprocessing of the evaluation of the notebooks, ImageDataGenerator(rescale=1./255)
+def notebook_preprocess(images):
+    return images.astype(np.float32) / 255.0
+
+# Load and preprocess images already segmented, in batches, with the paths that could be read
+def load_batches(paths, batch_size=32, preprocess=preprocess_batch):
+    for i in range(0, len(paths), batch_size):
+        loaded = [load_stage(path, segment=False)[:2] for path in paths[i:i + batch_size]]
+        for path, image in loaded:
+            if isinstance(image, Exception):
+                print(f'Skipping {path}: {image}', file=sys.stderr)
+        loaded = [(path, image) for path, image in loaded if not isinstance(image, Exception)]
+        if loaded:
+            yield [path for path, _ in loaded], preprocess(np.stack([image for _, image in loaded]))
+
+# Predict the class of every readable image with a registry, with the paths predicted
+def predict_classes(registry, name, paths, batch_size=32, preprocess=preprocess_batch):
+    predicted_paths, predictions = [], []
+    for batch_paths, batch in load_batches(paths, batch_size, preprocess):
+        predicted_paths.extend(batch_paths)
+        predictions.append(registry.predict(name, batch))
+    return predicted_paths, np.argmax(np.concatenate(predictions), axis=1)
+
+# Metrics of a registry on the test images
+def test_metrics(registry, name, test, preprocess=preprocess_batch):
+    labels = dict(test)
+    paths, predicted = predict_classes(registry, name, [path for path, _ in test], preprocess=preprocess)
+    true_labels = [label_index(name, labels[path]) for path in paths]
+    return compute_metrics(true_labels, predicted, len(CLASS_NAMES[name]))
+
+# Time of a single image through the backbone and head, without the cache
+def latency(registry, name, batches, repeats=3):
+    model = registry.get(name)
+    images = [image[np.newaxis] for batch in batches for image in batch]
+    times = []
+    for _ in range(repeats):
+        for image in images:
+            start_time = time.perf_counter()
+            model.head(model.backbone(image))
+            times.append(time.perf_counter() - start_time)
+    return float(np.median(times))
+
+# Size in bytes of the files of a converted model
+def exported_size(directory, name, variant):
+    entry = read_manifest(directory)['models'].get(name, {}).get('files', {}).get(variant)
+    if entry is None:
+        return None
+    return sum(os.path.getsize(os.path.join(directory, entry[part])) for part in ('backbone', 'head'))
+
+# Compare the INT8 model with the Keras model: size, latency and metrics
+#
+# Both models are compared with the preprocessing of the application
+# (preprocess_batch), the one the INT8 model was calibrated with and gets at
+# run time. The notebooks evaluate with rescale=1./255 instead, so the Keras
+# model is also evaluated that way, the metrics to compare with the notebooks.
+def build_report(names, directory, test, latency_batches):
+    keras = ModelRegistry(cache=EmbeddingCache(max_bytes=0))
+    int8 = ModelRegistry(cache=EmbeddingCache(max_bytes=0), engine='tflite-int8', export_dir=directory)
+
+    report = {}
+    for name in names:
+        keras_metrics = test_metrics(keras, name, test)
+        int8_metrics = test_metrics(int8, name, test)
+        notebook_metrics = test_metrics(keras, name, test, notebook_preprocess)
+        keras_latency = latency(keras, name, latency_batches)
+        int8_latency = latency(int8, name, latency_batches)
+        keras_size = os.path.getsize(MODEL_PATHS[name])
+        int8_size = exported_size(directory, name, 'int8')
+
+        report[name] = {
+            'size_bytes': {'keras': keras_size, 'float32': exported_size(directory, name, 'float32'), 'int8': int8_size},
+            'size_reduction': round(1 - int8_size / keras_size, 4),
+            'latency_ms': {'keras': round(keras_latency * 1000, 2), 'int8': round(int8_latency * 1000, 2)},
+            'latency_reduction': round(1 - int8_latency / keras_latency, 4),
+            'metrics': {'keras': keras_metrics, 'int8': int8_metrics, 'keras_notebook_preprocessing': notebook_metrics},
+            'delta': {key: round(int8_metrics[key] - keras_metrics[key], 4)
+                      for key in ('accuracy', 'precision', 'recall', 'specificity', 'f1')},
+        }
+    return report
+
+# Print the report of a model
+def print_report(name, result):
+    size = result['size_bytes']
+    print(f'== {name} ==')
+    print(f"Size: {round(size['keras'] / 2**20, 1)} MB -> {round(size['int8'] / 2**20, 1)} MB "
+          f"({round(result['size_reduction'] * 100, 1)}% smaller)")
+    print(f"Latency: {result['latency_ms']['keras']} ms -> {result['latency_ms']['int8']} ms per image "
+          f"({round(result['latency_reduction'] * 100, 1)}% faster)")
+    print('Keras (application preprocessing):')
+    print(format_metrics(result['metrics']['keras']))
+    print('INT8 (application preprocessing):')
+    print(format_metrics(result['metrics']['int8']))
+    print('Keras (notebook preprocessing, rescale 1/255):')
+    print(format_metrics(result['metrics']['keras_notebook_preprocessing']))
+    print('Delta (INT8 - Keras, application preprocessing): ' + ', '.join(f'{key} {round(value * 100, 2)}%' for key, value in result['delta'].items()))
+
+# Read the command line options
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Quantize the classifiers to INT8 and report the gains.')
+    parser.add_argument('--models', nargs='+', choices=list(CLASS_NAMES), default=list(CLASS_NAMES))
+    parser.add_argument('--images', default=SEGMENTED_DIR, help='folder with the segmented images, one folder per label')
+    parser.add_argument('--output', default=EXPORT_DIR, help='directory of the converted models')
+    parser.add_argument('--calibration-samples', type=int, default=200)
+    parser.add_argument('--latency-samples', type=int, default=20)
+    parser.add_argument('--report-only', action='store_true', help='only compare the models already quantized')
+    return parser.parse_args(argv)
+
+# Main function
+def main(argv=None):
+    args = parse_args(argv)
+    train, test = labelled_images(args.images)
+    if not train or not test:
+        print(f'No segmented images found in {args.images}, run the segmentation of the notebooks first')
+        return 1
+
+    # Calibrate with training images only, the metrics use the test images
+    random = np.random.default_rng(42)
+    sample = [train[i][0] for i in random.permutation(len(train))[:args.calibration_samples]]
+    calibration = [batch for _, batch in load_batches(sample)]
+    if not args.report_only:
+        export(args.models, args.output, variant='int8', calibration=calibration)
+
+    latency_batches = [batch for _, batch in load_batches(sample[:args.latency_samples])]
+    report = build_report(args.models, args.output, test, latency_batches)
+    for name, result in report.items():
+        print_report(name, result)
+
+    # Save the report, with the confusion matrices as lists for JSON
+    for result in report.values():
+        for metrics in result['metrics'].values():
+            metrics['confusion_matrix'] = metrics['confusion_matrix'].tolist()
+    with open(os.path.join(args.output, 'quantization_report.json'), 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=2)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,254 @@
+# Daniel Vitor de Oliveira Santos, 716417, Ciência da Computação Coração Eucarístico
+# Guilherme Cosso Lima Pimenta, gclpimenta@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+# Larissa Kaweski Siqueira, larissa.kaweski@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+import threading
+from collections import OrderedDict
+import cv2
+import numpy as np
+
+# Crop the image
+def crop_image(image):
+    # Get the dimensions of the image
+    height, width = image.shape[:2]
+
+    # Define the coordinates of the region of interest (ROI)
+    x = 15
+    y = 15
+    crop_width = width - 30
+    crop_height = height - 30
+
+    return image[y:y+crop_height, x:x+crop_width]
+
+# Find the optimal gamma for the image
+def find_optimal_gamma(image):
+    # Calculate average of pixels
+    mean = np.mean(image)
+
+    # Return the optimal gamma number for this image
+    return np.log(mean) / np.log(512)
+
+# Identify the largest object in the image
+def biggest_object(image):
+    # Perform labeling of connected components
+    num_labels, labels, stats, centroids = cv2.connectedComponentsWithStats(image)
+
+    # Find the index of the largest object (excluding the background)
+    largest_label = np.argmax(stats[1:, cv2.CC_STAT_AREA]) + 1
+
+    # Create a mask only for the largest object
+    return np.uint8(labels == largest_label) * 255
+
+# Segment a image, the original implementation kept as reference for the engine
+def segment_image_reference(image):
+    # Crop image, removing 15 pixels from the edges
+    cropped = crop_image(image)
+
+    # Set the ideal gamma
+    gamma = find_optimal_gamma(image)
+
+    # Apply gamma and Otsu transformation if necessary, otherwise apply only Threhold Binary
+    if gamma >= 0.6:
+        gamma_corrected = np.power(cropped / 255.0, gamma)
+        image_filtered = np.uint8(gamma_corrected * 255)
+        _, result = cv2.threshold(image_filtered, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    else:
+        image_filtered = cropped
+        _, result = cv2.threshold(image_filtered, 1, maxval=255, type=cv2.THRESH_BINARY)
+
+    # Largest object in the image (breast)
+    image_biggest = biggest_object(result)
+
+    # Match the mask of the largest object with the original cropped image
+    return cv2.bitwise_and(cropped, cropped, mask=image_biggest)
+
+# Gamma lookup table, the same values np.uint8(np.power(p / 255.0, gamma) * 255) gives per pixel
+def gamma_lut(gamma):
+    return np.uint8(np.power(np.arange(256) / 255.0, gamma) * 255)
+
+# Cache of gamma tables, with gamma rounded to a precision
+#
+# With precision None (the default) the key is the exact gamma and the tables
+# give the same bytes as the reference, but the gamma comes from the mean of
+# each image, so different images almost never share a table: the cache only
+# helps when the same image is segmented again. Sharing tables across images
+# needs a precision, set with set_gamma_precision (--gamma-precision). With a
+# precision like 0.001 nearby gammas share a table, at the cost of table
+# entries one level off, which changed up to about 9% of the filtered pixels of
+# an image in benchmark_segmentation.py --gamma-precision. What it checks is
+# that the segmented images stay the same, which they did on its images.
+class GammaLUTCache:
+    def __init__(self, precision=None, maxsize=64):
+        self.precision = precision
+        self.maxsize = maxsize
+        self.tables = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    # Gamma actually used for a gamma, after the rounding
+    def quantize(self, gamma):
+        if self.precision is None:
+            return float(gamma)
+        return round(float(gamma) / self.precision) * self.precision
+
+    # Get the table of a gamma, building it when not in the cache
+    def get(self, gamma):
+        key = float(gamma) if self.precision is None else round(float(gamma) / self.precision)
+        with self.lock:
+            table = self.tables.get(key)
+            if table is not None:
+                self.tables.move_to_end(key)
+                self.hits += 1
+                return table
+            self.misses += 1
+
+        table = gamma_lut(np.float64(gamma) if self.precision is None else self.quantize(gamma))
+        with self.lock:
+            self.tables[key] = table
+            while len(self.tables) > self.maxsize:
+                self.tables.popitem(last=False)
+        return table
+
+    # Hits, misses and size of the cache
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self.tables),
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+# Segmentation reusing its buffers between images
+#
+# Gives the same bytes as segment_image_reference, but the gamma goes through a
+# 256 entry table (cv2.LUT) instead of float64 copies of the whole image, and
+# the mask of the largest object is written in place. The buffers are kept
+# while the images have the same size, so an engine must not be shared between
+# threads, use default_engine() to get one per thread.
+#
+# With scale > 1 the Otsu branch (gamma >= 0.6) thresholds and finds the
+# connected components on the image reduced by that factor, and the mask is
+# scaled back to the full crop. It is no longer byte-identical to the
+# reference, the border of the mask is off by up to scale pixels. The fixed
+# threshold branch (gamma < 0.6) always runs at full resolution: its mask
+# follows the dark pixels of the background one by one, which a reduced image
+# can not represent (IoU about 0.9), and it has no gamma to save.
+class SegmentationEngine:
+    def __init__(self, lut_cache=None, scale=1):
+        self.shape = None
+        self.lut_cache = lut_cache if lut_cache is not None else GammaLUTCache()
+        self.scale = int(scale)
+        if self.scale < 1:
+            raise ValueError(f'the mask scale must be at least 1, got {scale}')
+
+        # Engine of the reduced image, with its own buffers
+        self.proxy = SegmentationEngine(self.lut_cache) if self.scale > 1 else None
+
+    # Allocate the buffers for the size of the cropped image
+    def allocate(self, shape):
+        if self.shape != shape:
+            self.shape = shape
+            self.filtered = np.empty(shape, dtype=np.uint8)
+            self.mask = np.empty(shape, dtype=np.uint8)
+            self.labels = np.empty(shape, dtype=np.int32)
+            self.selected = np.empty(shape, dtype=bool)
+
+    # Threshold the cropped image into the mask buffer
+    def threshold(self, cropped, gamma):
+        # Apply gamma and Otsu transformation if necessary, otherwise apply only Threhold Binary
+        if gamma >= 0.6:
+            cv2.LUT(cropped, self.lut_cache.get(gamma), dst=self.filtered)
+            cv2.threshold(self.filtered, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU, dst=self.mask)
+        else:
+            cv2.threshold(cropped, 1, 255, cv2.THRESH_BINARY, dst=self.mask)
+
+    # Keep only the largest object of a 0/255 mask (the mask buffer by default) in the mask buffer
+    def biggest_object(self, mask=None):
+        _, _, stats, _ = cv2.connectedComponentsWithStats(self.mask if mask is None else mask, labels=self.labels)
+
+        # Find the index of the largest object (excluding the background)
+        largest_label = np.argmax(stats[1:, cv2.CC_STAT_AREA]) + 1
+
+        # 0/255 mask of the largest object, without a new boolean or uint8 image
+        np.equal(self.labels, largest_label, out=self.selected)
+        np.multiply(self.selected.view(np.uint8), 255, out=self.mask)
+
+    # Largest object of a 0/255 mask, written in the mask buffer (for masks computed outside the engine)
+    def largest_object(self, mask):
+        self.allocate(mask.shape)
+        self.biggest_object(mask)
+        return self.mask
+
+    # Compute the mask on the reduced image and scale it to the mask buffer
+    def scaled_mask(self, cropped, gamma):
+        height, width = cropped.shape
+        reduced = cv2.resize(cropped, (max(1, width // self.scale), max(1, height // self.scale)),
+                             interpolation=cv2.INTER_AREA)
+        self.proxy.allocate(reduced.shape)
+        self.proxy.threshold(reduced, gamma)
+        self.proxy.biggest_object()
+        cv2.resize(self.proxy.mask, (width, height), dst=self.mask, interpolation=cv2.INTER_NEAREST)
+
+    # Compute the breast mask, returning the cropped image and the mask buffer
+    def compute_mask(self, image):
+        cropped = crop_image(image)
+        self.allocate(cropped.shape)
+        gamma = find_optimal_gamma(image)
+        if self.scale > 1 and gamma >= 0.6:
+            self.scaled_mask(cropped, gamma)
+        else:
+            self.threshold(cropped, gamma)
+            self.biggest_object()
+        return cropped, self.mask
+
+    # Segment a image, writing into out when given
+    def segment(self, image, out=None):
+        cropped, mask = self.compute_mask(image)
+        if out is None:
+            out = np.empty(cropped.shape, dtype=np.uint8)
+
+        # The mask is 0 or 255, so the AND keeps the breast and clears the rest
+        return cv2.bitwise_and(cropped, mask, dst=out)
+
+# Intersection over union of two 0/255 masks
+def mask_iou(mask, reference):
+    intersection = np.count_nonzero(cv2.bitwise_and(mask, reference))
+    union = np.count_nonzero(cv2.bitwise_or(mask, reference))
+    return intersection / union if union else 1.0
+
+# Engines of each thread
+_engines = threading.local()
+
+# Gamma tables shared by the engines of this process
+_lut_cache = GammaLUTCache()
+
+# Round gamma to a precision in the engines of this process (None for the exact gamma)
+def set_gamma_precision(precision, maxsize=64):
+    global _lut_cache
+    _lut_cache = GammaLUTCache(precision, maxsize)
+
+# Cache of gamma tables used by the engines of this process
+def default_lut_cache():
+    return _lut_cache
+
+# Scale of the mask in the engines of this process (1 for the full resolution mask)
+_mask_scale = 1
+
+# Compute the masks of the Otsu branch on images reduced by scale in the engines of this process
+def set_mask_scale(scale):
+    global _mask_scale
+    if int(scale) < 1:
+        raise ValueError(f'the mask scale must be at least 1, got {scale}')
+    _mask_scale = int(scale)
+
+# Get the segmentation engine of the current thread
+def default_engine():
+    engine = getattr(_engines, 'engine', None)
+    if engine is None or engine.lut_cache is not _lut_cache or engine.scale != _mask_scale:
+        engine = _engines.engine = SegmentationEngine(_lut_cache, _mask_scale)
+    return engine
+
+# Segment a image
+def segment_image(image):
+    return default_engine().segment(image)
@@ -0,0 +1,222 @@
+# Daniel Vitor de Oliveira Santos, 716417, Ciência da Computação Coração Eucarístico
+# Guilherme Cosso Lima Pimenta, gclpimenta@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+# Larissa Kaweski Siqueira, larissa.kaweski@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+from concurrent.futures import Future
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import cv2
+import numpy as np
+
+from models import CLASS_NAMES, ModelRegistry, prepare_image, preprocess_batch, decode_prediction
+from embedding_cache import EmbeddingCache
+from engines import ENGINES
+from segmentation import segment_image
+from pipeline import decode_image
+
+# Largest upload accepted, a 16-bit 4K x 3K TIFF is about 24 MB
+MAX_UPLOAD_BYTES = 64 * 1024 * 1024
+
+# One image waiting to be classified
+class PendingRequest:
+    def __init__(self, names, image):
+        self.names = names
+        self.image = image
+        self.future = Future()
+        self.enqueued = time.perf_counter()
+
+# Gather concurrent requests into batches before calling the models
+#
+# The first request of a batch waits at most max_latency for others to arrive,
+# so a single client is not slowed down and many clients share each predict.
+class MicroBatcher:
+    def __init__(self, registry, max_batch_size=16, max_latency=0.01):
+        self.registry = registry
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.requests = queue.Queue()
+        self.thread = threading.Thread(target=self.loop, daemon=True)
+        self.thread.start()
+
+    # Add an image to the next batch, the future receives the result
+    def submit(self, names, image):
+        request = PendingRequest(names, image)
+        self.requests.put(request)
+        return request.future
+
+    # Wait for the first request, then collect others until the batch is full or the deadline
+    def collect(self):
+        batch = [self.requests.get()]
+        deadline = batch[0].enqueued + self.max_latency
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    # Run the batches forever
+    def loop(self):
+        while True:
+            batch = self.collect()
+            start_time = time.perf_counter()
+            try:
+                images = preprocess_batch(np.stack([request.image for request in batch]))
+                names = sorted({name for request in batch for name in request.names})
+                predictions = self.registry.predict_all(images, names)
+            except Exception as error:
+                for request in batch:
+                    request.future.set_exception(error)
+                continue
+            end_time = time.perf_counter()
+
+            # An error in the result of one request fails only that request, the thread keeps running
+            for i, request in enumerate(batch):
+                try:
+                    result = {}
+                    for name in request.names:
+                        label, confidence = decode_prediction(name, predictions[name][i])
+                        result[name] = {
+                            'label': label,
+                            'confidence': float(confidence),
+                            'probabilities': dict(zip(CLASS_NAMES[name], map(float, predictions[name][i]))),
+                        }
+                    result['timing'] = {
+                        'queue_ms': round((start_time - request.enqueued) * 1000, 2),
+                        'compute_ms': round((end_time - start_time) * 1000, 2),
+                        'batch_size': len(batch),
+                    }
+                except Exception as error:
+                    request.future.set_exception(error)
+                    continue
+                request.future.set_result(result)
+
+# Get the file from a multipart/form-data body
+def read_multipart(content_type, body):
+    message = BytesParser().parsebytes(b'Content-Type: ' + content_type.encode() + b'\r\n\r\n' + body)
+    for part in message.iter_parts():
+        if part.get_filename() or part.get_content_maintype() in ('image', 'application'):
+            return part.get_payload(decode=True)
+    raise ValueError('no file in the multipart body')
+
+# Answer the classification requests
+class ClassificationHandler(BaseHTTPRequestHandler):
+    batcher = None
+    segment_default = True
+
+    # Send a JSON answer
+    def send_json(self, status, content):
+        data = json.dumps(content).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if urlparse(self.path).path == '/health':
+            self.send_json(200, {'status': 'ok', 'models': list(CLASS_NAMES)})
+        else:
+            self.send_json(404, {'error': 'not found'})
+
+    # POST /classify?model=binary|multiclass|all&segment=0|1 with the image as the body
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != '/classify':
+            self.send_json(404, {'error': 'not found'})
+            return
+
+        query = parse_qs(url.query)
+        model = query.get('model', ['all'])[0]
+        names = list(CLASS_NAMES) if model == 'all' else [model]
+        if any(name not in CLASS_NAMES for name in names):
+            self.send_json(400, {'error': f'unknown model {model}'})
+            return
+        segment = query.get('segment', ['1' if self.segment_default else '0'])[0] not in ('0', 'false')
+
+        # The body is read by its length, so it must be given and be a number
+        if self.headers.get('Content-Length') is None:
+            self.send_json(411, {'error': 'Content-Length is required'})
+            return
+        try:
+            length = int(self.headers['Content-Length'])
+        except ValueError:
+            self.send_json(400, {'error': 'invalid Content-Length'})
+            return
+        if length <= 0 or length > MAX_UPLOAD_BYTES:
+            self.send_json(413 if length > 0 else 400, {'error': 'invalid upload size'})
+            return
+
+        try:
+            body = self.rfile.read(length)
+            content_type = self.headers.get('Content-Type', '')
+            if content_type.startswith('multipart/form-data'):
+                body = read_multipart(content_type, body)
+
+            # Decode and segment here, so they run in parallel in the request threads
+            start_time = time.perf_counter()
+            image = decode_image(np.frombuffer(body, dtype=np.uint8))
+            if image is None:
+                raise ValueError('could not decode the image, send PNG, JPG or TIFF')
+            if segment:
+                image = segment_image(image)
+            image = prepare_image(image)
+            preprocess_ms = round((time.perf_counter() - start_time) * 1000, 2)
+        except (ValueError, cv2.error) as error:
+            self.send_json(400, {'error': str(error)})
+            return
+
+        try:
+            result = self.batcher.submit(names, image).result()
+        except Exception as error:
+            self.send_json(500, {'error': str(error)})
+            return
+        result['timing']['preprocess_ms'] = preprocess_ms
+        self.send_json(200, result)
+
+# Read the command line options
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Local HTTP service for the mammogram classifiers.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--max-batch-size', type=int, default=16)
+    parser.add_argument('--max-latency-ms', type=float, default=10.0,
+                        help='maximum time the first request of a batch waits for others')
+    parser.add_argument('--no-segment', action='store_true', help='the uploads are already segmented')
+    parser.add_argument('--cache-dir', default=None, help='directory to keep the results between runs')
+    parser.add_argument('--engine', choices=ENGINES, default='keras',
+                        help='runtime of the models, tflite needs export_models.py to be run first')
+    return parser.parse_args(argv)
+
+# Main function
+def main(argv=None):
+    args = parse_args(argv)
+    registry = ModelRegistry(cache=EmbeddingCache(directory=args.cache_dir), engine=args.engine)
+
+    # Load the models before accepting requests
+    for name in CLASS_NAMES:
+        registry.get(name)
+
+    ClassificationHandler.batcher = MicroBatcher(registry, args.max_batch_size, args.max_latency_ms / 1000)
+    ClassificationHandler.segment_default = not args.no_segment
+    server = ThreadingHTTPServer((args.host, args.port), ClassificationHandler)
+    print(f'Listening on http://{args.host}:{args.port}/classify')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
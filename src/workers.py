@@ -0,0 +1,112 @@
+# Daniel Vitor de Oliveira Santos, 716417, Ciência da Computação Coração Eucarístico
+# Guilherme Cosso Lima Pimenta, gclpimenta@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+# Larissa Kaweski Siqueira, larissa.kaweski@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+import traceback
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+# Signals used by the worker to talk back to the GUI thread
+class WorkerSignals(QObject):
+    # Request id and the value returned by the task
+    finished = pyqtSignal(int, object)
+
+    # Request id and the error message
+    failed = pyqtSignal(int, str)
+
+    # Emitted when the task leaves the thread, cancelled or not
+    done = pyqtSignal(int)
+
+# Run a task outside the Qt event loop
+class Worker(QRunnable):
+    def __init__(self, request_id, task, *args):
+        super(Worker, self).__init__()
+        self.request_id = request_id
+        self.task = task
+        self.args = args
+        self.signals = WorkerSignals()
+        self.cancelled = False
+
+    # Mark the request as cancelled, the result will be discarded
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self):
+        try:
+            # The request was replaced before it started
+            if self.cancelled:
+                return
+
+            try:
+                result = self.task(*self.args)
+            except Exception:
+                if not self.cancelled:
+                    self.signals.failed.emit(self.request_id, traceback.format_exc())
+                return
+
+            # A running predict can not be interrupted, so only drop its result
+            if not self.cancelled:
+                self.signals.finished.emit(self.request_id, result)
+        finally:
+            self.signals.done.emit(self.request_id)
+
+# Keep only the latest request alive, replacing the previous one
+class LatestRequestRunner(QObject):
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, parent=None):
+        super(LatestRequestRunner, self).__init__(parent)
+
+        # A single thread keeps the model calls serialized
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        self.request_id = 0
+        self.worker = None
+
+        # Keep a reference to every worker until it leaves the thread pool
+        self.workers = {}
+
+    # Check if there is a request still waiting for its result
+    def is_running(self):
+        return self.worker is not None
+
+    # Cancel the current request, removing it from the queue if not started
+    def cancel(self):
+        if self.worker is not None:
+            self.worker.cancel()
+            if self.pool.tryTake(self.worker):
+                self.workers.pop(self.worker.request_id, None)
+            self.worker = None
+        self.request_id += 1
+
+    # Start a new request, cancelling the one still running
+    def submit(self, task, *args):
+        self.cancel()
+        self.worker = Worker(self.request_id, task, *args)
+        self.worker.setAutoDelete(False)
+        self.worker.signals.finished.connect(self.on_finished)
+        self.worker.signals.failed.connect(self.on_failed)
+        self.worker.signals.done.connect(self.on_done)
+        self.workers[self.request_id] = self.worker
+        self.pool.start(self.worker)
+        return self.request_id
+
+    # Forward only the result of the latest request
+    def on_finished(self, request_id, result):
+        if request_id == self.request_id:
+            self.worker = None
+            self.finished.emit(result)
+
+    # Forward only the error of the latest request
+    def on_failed(self, request_id, message):
+        if request_id == self.request_id:
+            self.worker = None
+            self.failed.emit(message)
+
+    # Release the worker once it is no longer used by the thread pool
+    def on_done(self, request_id):
+        self.workers.pop(request_id, None)
+
+    # Wait for the thread to finish when closing the application
+    def shutdown(self):
+        self.cancel()
+        self.pool.waitForDone()
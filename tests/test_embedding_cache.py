@@ -0,0 +1,84 @@
+# Daniel Vitor de Oliveira Santos, 716417, Ciência da Computação Coração Eucarístico
+# Guilherme Cosso Lima Pimenta, gclpimenta@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+# Larissa Kaweski Siqueira, larissa.kaweski@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+import numpy as np
+
+import embedding_cache
+from embedding_cache import EmbeddingCache, image_key
+
+def embedding(value):
+    return np.full(2048, value, dtype=np.float32)
+
+def test_key_depends_on_pixels_and_fingerprint():
+    image = np.zeros((224, 224, 3), dtype=np.float32)
+    changed = image.copy()
+    changed[0, 0, 0] = 1
+    assert image_key('a', image) == image_key('a', image.copy())
+    assert image_key('a', image) != image_key('a', changed)
+    assert image_key('a', image) != image_key('b', image)
+
+# The least recently used entries are removed above the memory budget
+def test_lru_budget():
+    cache = EmbeddingCache(max_bytes=2 * 2048 * 4)
+    cache.put('a', embedding(1))
+    cache.put('b', embedding(2))
+    assert cache.get('a') is not None
+    cache.put('c', embedding(3))
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
+    assert cache.size == 2 * 2048 * 4
+
+def test_entries_are_read_from_disk(tmp_path):
+    cache = EmbeddingCache(directory=str(tmp_path))
+    cache.put('a', embedding(1), {'binary': np.array([0.25, 0.75], dtype=np.float32)})
+
+    reopened = EmbeddingCache(directory=str(tmp_path))
+    entry = reopened.get('a')
+    np.testing.assert_array_equal(entry.embedding, embedding(1))
+    np.testing.assert_array_equal(entry.outputs['binary'], [0.25, 0.75])
+    assert (reopened.hits, reopened.misses) == (1, 0)
+    assert reopened.get('b') is None and reopened.misses == 1
+
+# An image added by another thread while its file is read is not added again
+def test_get_keeps_entry_added_while_reading(tmp_path, monkeypatch):
+    EmbeddingCache(directory=str(tmp_path)).put('a', embedding(1))
+    cache = EmbeddingCache(directory=str(tmp_path))
+    read = cache.read
+
+    def read_while_other_thread_puts(key):
+        entry = read(key)
+        cache.put(key, embedding(2))
+        return entry
+    monkeypatch.setattr(cache, 'read', read_while_other_thread_puts)
+
+    entry = cache.get('a')
+    np.testing.assert_array_equal(entry.embedding, embedding(2))
+    assert len(cache) == 1
+    assert cache.size == entry.nbytes()
+
+# The file is written from a copy of the entry, outputs added during the write are not lost
+def test_put_writes_a_copy_of_the_entry(tmp_path, monkeypatch):
+    cache = EmbeddingCache(directory=str(tmp_path))
+    write = cache.write
+    written = []
+
+    def write_while_other_thread_puts(key, entry):
+        written.append(entry)
+        if len(written) == 1:
+            cache.entries[key].outputs['multiclass'] = np.ones(4, dtype=np.float32)
+            assert 'multiclass' not in entry.outputs
+        write(key, entry)
+    monkeypatch.setattr(cache, 'write', write_while_other_thread_puts)
+
+    live = cache.put('a', embedding(1), {'binary': np.zeros(2, dtype=np.float32)})
+    assert written[0] is not live
+    cache.put('a', outputs={'binary': np.ones(2, dtype=np.float32)})
+
+    entry = EmbeddingCache(directory=str(tmp_path)).get('a')
+    assert sorted(entry.outputs) == ['binary', 'multiclass']
+
+def test_memory_only_cache_writes_nothing(tmp_path, monkeypatch):
+    cache = EmbeddingCache()
+    monkeypatch.setattr(embedding_cache.tempfile, 'mkstemp', None)
+    cache.put('a', embedding(1))
+    assert cache.get('a') is not None
@@ -0,0 +1,82 @@
+# Daniel Vitor de Oliveira Santos, 716417, Ciência da Computação Coração Eucarístico
+# Guilherme Cosso Lima Pimenta, gclpimenta@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+# Larissa Kaweski Siqueira, larissa.kaweski@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+import os
+import cv2
+import numpy as np
+import pytest
+
+tf = pytest.importorskip('tensorflow')
+
+from feature_store import build_features, load_features, train_head
+from preprocessing import get_dataset
+from shards import export_shard, read_shard
+
+# Backbone giving the mean of each channel of the image, so the features of an image are known
+def mean_backbone(size=16):
+    return tf.keras.Sequential([tf.keras.Input((size, size, 3)), tf.keras.layers.GlobalAveragePooling2D()])
+
+# Dataset of small images in two label folders, each image filled with its number
+@pytest.fixture
+def dataset(tmp_path):
+    for number in range(1, 13):
+        label = 'I' if number % 2 else 'II'
+        os.makedirs(tmp_path / 'images' / label, exist_ok=True)
+        image = np.full((40, 30), number * 10, dtype=np.uint8)
+        cv2.imencode('.png', image)[1].tofile(str(tmp_path / 'images' / label / f'image ({number}).png'))
+    return get_dataset(tmp_path / 'images').sort_values('Filepath').reset_index(drop=True)
+
+# The features are stored in the order of the shard
+def check_features(features, prefix):
+    images, _, _ = read_shard(prefix)
+    np.testing.assert_allclose(features[:, 0], images.mean(axis=(1, 2)) / 255, rtol=1e-3)
+
+def test_features_follow_the_shard(dataset, tmp_path):
+    prefix = export_shard(dataset, str(tmp_path / 'train'), image_size=16)
+    features = build_features(prefix, mean_backbone(), batch_size=5)
+    assert features.dtype == np.float16 and features.shape == (len(dataset), 3)
+    check_features(features, prefix)
+
+def test_same_shard_reuses_features(dataset, tmp_path, capsys):
+    prefix = export_shard(dataset, str(tmp_path / 'train'), image_size=16)
+    build_features(prefix, mean_backbone())
+    capsys.readouterr()
+    build_features(prefix, mean_backbone())
+    assert 'already computed' in capsys.readouterr().out
+
+# A shard packed again with the same rows in another order gets new features
+def test_reordered_shard_recomputes_features(dataset, tmp_path, capsys):
+    prefix = export_shard(dataset, str(tmp_path / 'train'), image_size=16)
+    build_features(prefix, mean_backbone())
+    export_shard(dataset.sample(frac=1, random_state=1).reset_index(drop=True), prefix, image_size=16)
+    capsys.readouterr()
+
+    features = build_features(prefix, mean_backbone())
+    assert 'already computed' not in capsys.readouterr().out
+    check_features(features, prefix)
+
+# The features stay memory mapped, each batch is converted to float32
+def test_load_features_reads_batches(dataset, tmp_path):
+    prefix = export_shard(dataset, str(tmp_path / 'train'), image_size=16)
+    sequence = load_features(prefix, mean_backbone(), batch_size=5, shuffle=True)
+    assert isinstance(sequence.features, np.memmap)
+    assert len(sequence) == 3
+
+    _, labels, _ = read_shard(prefix)
+    seen = []
+    for index in range(len(sequence)):
+        features, one_hot = sequence[index]
+        assert features.dtype == np.float32 and one_hot.shape == (len(features), 2)
+        seen.extend(features[:, 0].round(3).tolist())
+        for row, label in zip(features, one_hot.argmax(axis=1)):
+            position = int(np.argmin(np.abs(sequence.features[:, 0].astype(np.float32) - row[0])))
+            assert labels[position] == label
+    np.testing.assert_allclose(sorted(seen), np.sort(sequence.features[:, 0].astype(np.float32)).round(3))
+
+def test_train_head_returns_history(dataset, tmp_path):
+    train = export_shard(dataset[:8], str(tmp_path / 'train'), ['I', 'II'], image_size=16)
+    validation = export_shard(dataset[8:], str(tmp_path / 'validation'), ['I', 'II'], image_size=16)
+    head, history = train_head(train, validation, mean_backbone(), epochs=2, batch_size=4)
+    assert set(history.history) >= {'acc', 'loss', 'val_acc', 'val_loss'}
+    assert len(history.history['val_acc']) == 2
+    assert head.predict(np.zeros((1, 3), dtype=np.float32), verbose=0).shape == (1, 2)
@@ -0,0 +1,72 @@
+# Daniel Vitor de Oliveira Santos, 716417, Ciência da Computação Coração Eucarístico
+# Guilherme Cosso Lima Pimenta, gclpimenta@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+# Larissa Kaweski Siqueira, larissa.kaweski@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+import numpy as np
+import pytest
+
+from metrics import compute_metrics, confusion_matrix, format_metrics, specificity_per_class
+
+# Specificity of the evaluation cell of the notebooks, removing the row and column of each class
+def notebook_specificity(confusion_mat, num_classes):
+    specificity = []
+    for i in range(num_classes):
+        tn = np.sum(np.delete(np.delete(confusion_mat, i, axis=0), i, axis=1))
+        fp = np.sum(np.delete(confusion_mat, i, axis=0)[:, i])
+        specificity.append(tn / (tn + fp))
+    return specificity
+
+# True labels and predictions right about 70% of the time
+def predictions(num_classes, size, seed):
+    random = np.random.default_rng(seed)
+    true_labels = random.integers(0, num_classes, size=size)
+    wrong = random.random(size) < 0.3
+    predicted_labels = np.where(wrong, random.integers(0, num_classes, size=size), true_labels)
+    return true_labels, predicted_labels
+
+@pytest.mark.parametrize('num_classes', [2, 4])
+@pytest.mark.parametrize('seed', range(5))
+def test_specificity_matches_notebook_loop(num_classes, seed):
+    true_labels, predicted_labels = predictions(num_classes, 500, seed)
+    metrics = compute_metrics(true_labels, predicted_labels, num_classes)
+    expected = notebook_specificity(metrics['confusion_matrix'], num_classes)
+
+    np.testing.assert_allclose(specificity_per_class(metrics['confusion_matrix']), expected)
+    assert metrics['specificity'] == pytest.approx(np.mean(expected))
+
+@pytest.mark.parametrize('num_classes', [2, 4])
+def test_confusion_matrix_counts_pairs(num_classes):
+    true_labels, predicted_labels = predictions(num_classes, 300, seed=1)
+    expected = np.zeros((num_classes, num_classes), dtype=np.int64)
+    for true, predicted in zip(true_labels, predicted_labels):
+        expected[true, predicted] += 1
+    np.testing.assert_array_equal(confusion_matrix(true_labels, predicted_labels, num_classes), expected)
+
+@pytest.mark.parametrize('num_classes', [2, 4])
+def test_metrics_match_sklearn(num_classes):
+    sklearn_metrics = pytest.importorskip('sklearn.metrics')
+    true_labels, predicted_labels = predictions(num_classes, 500, seed=3)
+    metrics = compute_metrics(true_labels, predicted_labels, num_classes)
+
+    assert metrics['accuracy'] == pytest.approx(sklearn_metrics.accuracy_score(true_labels, predicted_labels))
+    for name, score in (('precision', sklearn_metrics.precision_score), ('recall', sklearn_metrics.recall_score),
+                        ('f1', sklearn_metrics.f1_score)):
+        assert metrics[name] == pytest.approx(score(true_labels, predicted_labels, average='weighted'))
+    np.testing.assert_array_equal(metrics['confusion_matrix'],
+                                  sklearn_metrics.confusion_matrix(true_labels, predicted_labels))
+
+# A class that is never predicted has no precision, counted as 0 like zero_division=0
+def test_class_never_predicted():
+    metrics = compute_metrics([0, 1, 2, 2], [0, 1, 1, 1], 3)
+    assert metrics['accuracy'] == pytest.approx(0.5)
+    assert metrics['precision'] == pytest.approx(0.25 * 1 + 0.25 * 1 / 3)
+    assert metrics['specificity'] == pytest.approx(np.mean(notebook_specificity(metrics['confusion_matrix'], 3)))
+
+def test_format_metrics():
+    metrics = {'accuracy': 0.5, 'precision': 0.25, 'recall': 0.125, 'specificity': 0.75, 'f1': 1 / 3}
+    assert format_metrics(metrics).splitlines() == [
+        'Accuracy: 50.0%',
+        'Precision: 25.0%',
+        'Recall (Sensibility): 12.5%',
+        'Mean Specificity: 75.0%',
+        'F1-Score: 33.33%',
+    ]
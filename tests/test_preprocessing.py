@@ -0,0 +1,151 @@
+# Daniel Vitor de Oliveira Santos, 716417, Ciência da Computação Coração Eucarístico
+# Guilherme Cosso Lima Pimenta, gclpimenta@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+# Larissa Kaweski Siqueira, larissa.kaweski@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+import os
+import cv2
+import pytest
+
+import preprocessing
+from benchmark_segmentation import synthetic_mammogram
+from preprocessing import MANIFEST_NAME, build_outputs, get_dataset, read_manifest, segment_dataset, augment_dataset
+from segmentation import segment_image_reference
+
+# Write an image as a PNG
+def save_png(path, image):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    ok, data = cv2.imencode('.png', image)
+    assert ok
+    data.tofile(str(path))
+
+# Dataset of a few synthetic mammograms in two label folders
+@pytest.fixture
+def dataset_dir(tmp_path):
+    images = tmp_path / 'images'
+    for number in range(1, 5):
+        label = 'I' if number % 2 else 'II'
+        image = synthetic_mammogram(240, 180, brightness=230 if number % 2 else 60, seed=number)
+        save_png(images / label / f'image ({number}).png', image)
+    return images
+
+# Modification time of every output
+def output_times(output_dir):
+    return {path: os.stat(path).st_mtime_ns for path in output_dir.glob('**/*.png')}
+
+def test_first_run_segments_every_image(dataset_dir, tmp_path):
+    output_dir = tmp_path / 'segmented'
+    result = segment_dataset(get_dataset(dataset_dir), str(output_dir), workers=1)
+    assert (result['total'], result['skipped'], result['processed'], result['failed']) == (4, 0, 4, [])
+
+    manifest = read_manifest(str(output_dir))
+    assert len(manifest['entries']) == 4
+    for source, entry in manifest['entries'].items():
+        [output] = entry['outputs']
+        ok, expected = cv2.imencode('.png', segment_image_reference(cv2.imread(source, cv2.IMREAD_GRAYSCALE)))
+        with open(output, 'rb') as file:
+            assert file.read() == expected.tobytes()
+
+def test_second_run_skips_everything(dataset_dir, tmp_path):
+    output_dir = tmp_path / 'segmented'
+    dataset = get_dataset(dataset_dir)
+    segment_dataset(dataset, str(output_dir), workers=1)
+    times = output_times(output_dir)
+
+    result = segment_dataset(dataset, str(output_dir), workers=1)
+    assert (result['skipped'], result['processed'], result['removed']) == (4, 0, 0)
+    assert output_times(output_dir) == times
+
+def test_changed_source_is_rebuilt(dataset_dir, tmp_path):
+    output_dir = tmp_path / 'segmented'
+    dataset = get_dataset(dataset_dir)
+    segment_dataset(dataset, str(output_dir), workers=1)
+
+    source = dataset_dir / 'I' / 'image (1).png'
+    image = synthetic_mammogram(240, 180, brightness=230, seed=99)
+    stat = os.stat(source)
+    save_png(source, image)
+
+    # A new modification time even on file systems with a coarse clock
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    result = segment_dataset(dataset, str(output_dir), workers=1)
+    assert (result['skipped'], result['processed']) == (3, 1)
+
+    ok, expected = cv2.imencode('.png', segment_image_reference(image))
+    assert (output_dir / 'I' / 'image (1).png').read_bytes() == expected.tobytes()
+
+# A copy of the same file has a new modification time, its hash says it is up to date
+def test_touched_source_is_not_rebuilt(dataset_dir, tmp_path):
+    output_dir = tmp_path / 'segmented'
+    dataset = get_dataset(dataset_dir)
+    segment_dataset(dataset, str(output_dir), workers=1)
+
+    source = dataset_dir / 'II' / 'image (2).png'
+    stat = os.stat(source)
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    result = segment_dataset(dataset, str(output_dir), workers=1)
+    assert (result['skipped'], result['processed']) == (4, 0)
+    assert read_manifest(str(output_dir))['entries'][os.path.normpath(str(source))]['mtime_ns'] == \
+        stat.st_mtime_ns + 10 ** 9
+
+def test_missing_output_is_rebuilt(dataset_dir, tmp_path):
+    output_dir = tmp_path / 'segmented'
+    dataset = get_dataset(dataset_dir)
+    segment_dataset(dataset, str(output_dir), workers=1)
+
+    output = output_dir / 'II' / 'image (4).png'
+    expected = output.read_bytes()
+    output.unlink()
+    result = segment_dataset(dataset, str(output_dir), workers=1)
+    assert (result['skipped'], result['processed']) == (3, 1)
+    assert output.read_bytes() == expected
+
+def test_removed_source_removes_its_output(dataset_dir, tmp_path):
+    output_dir = tmp_path / 'segmented'
+    segment_dataset(get_dataset(dataset_dir), str(output_dir), workers=1)
+
+    source = dataset_dir / 'I' / 'image (3).png'
+    source.unlink()
+    result = segment_dataset(get_dataset(dataset_dir), str(output_dir), workers=1)
+    assert (result['total'], result['skipped'], result['removed']) == (3, 3, 1)
+    assert not (output_dir / 'I' / 'image (3).png').exists()
+    assert os.path.normpath(str(source)) not in read_manifest(str(output_dir))['entries']
+
+def test_new_pipeline_version_rebuilds_everything(dataset_dir, tmp_path, monkeypatch):
+    output_dir = tmp_path / 'segmented'
+    dataset = get_dataset(dataset_dir)
+    segment_dataset(dataset, str(output_dir), workers=1)
+
+    monkeypatch.setattr(preprocessing, 'pipeline_version', lambda step: 'another version')
+    result = segment_dataset(dataset, str(output_dir), workers=1)
+    assert (result['skipped'], result['processed']) == (0, 4)
+
+def test_force_rebuilds_everything(dataset_dir, tmp_path):
+    output_dir = tmp_path / 'segmented'
+    dataset = get_dataset(dataset_dir)
+    segment_dataset(dataset, str(output_dir), workers=1)
+    result = segment_dataset(dataset, str(output_dir), workers=1, force=True)
+    assert (result['skipped'], result['processed']) == (0, 4)
+
+# An unreadable image fails alone and is not recorded, so the next run tries it again
+def test_unreadable_image_is_not_recorded(dataset_dir, tmp_path):
+    output_dir = tmp_path / 'segmented'
+    broken = dataset_dir / 'I' / 'image (5).png'
+    broken.write_bytes(b'not a png')
+
+    result = segment_dataset(get_dataset(dataset_dir), str(output_dir), workers=1)
+    assert result['processed'] == 4
+    assert [source for source, _ in result['failed']] == [os.path.normpath(str(broken))]
+    assert os.path.normpath(str(broken)) not in read_manifest(str(output_dir))['entries']
+
+    result = segment_dataset(get_dataset(dataset_dir), str(output_dir), workers=1)
+    assert (result['skipped'], len(result['failed'])) == (4, 1)
+
+def test_augment_writes_four_images_per_source(dataset_dir, tmp_path):
+    output_dir = tmp_path / 'augmented'
+    dataset = get_dataset(dataset_dir)
+    result = augment_dataset(dataset, str(output_dir), workers=1)
+    assert result['processed'] == 4
+    assert len(list(output_dir.glob('**/*.png'))) == 16
+    assert (output_dir / MANIFEST_NAME).exists()
+
+    result = build_outputs(dataset, str(output_dir), 'augment', workers=1)
+    assert (result['skipped'], result['processed']) == (4, 0)
@@ -0,0 +1,157 @@
+# Daniel Vitor de Oliveira Santos, 716417, Ciência da Computação Coração Eucarístico
+# Guilherme Cosso Lima Pimenta, gclpimenta@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+# Larissa Kaweski Siqueira, larissa.kaweski@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+from collections import Counter
+import numpy as np
+import pytest
+
+import processing_stack
+from benchmark_segmentation import synthetic_mammogram
+from processing_stack import ProcessingStack, freeze, optimal_gamma, segmentation_steps, step
+from segmentation import segment_image_reference
+
+# Count the calls of every operation of the stack
+@pytest.fixture
+def calls(monkeypatch):
+    counter = Counter()
+    for name, operation in list(processing_stack.OPERATIONS.items()):
+        def counted(*args, name=name, operation=operation, **kwargs):
+            counter[name] += 1
+            return operation(*args, **kwargs)
+        monkeypatch.setitem(processing_stack.OPERATIONS, name, counted)
+    return counter
+
+@pytest.fixture
+def image():
+    return freeze(synthetic_mammogram(240, 180, brightness=230))
+
+# Stack with a crop, a gamma and a threshold applied
+def segmented_stack(image):
+    stack = ProcessingStack(image)
+    stack.push(step('crop'), step('gamma', value=0.8), step('threshold'))
+    return stack
+
+def test_run_computes_each_prefix_once(image, calls):
+    stack = ProcessingStack(image)
+    steps = (step('crop'), step('gamma', value=0.8), step('threshold'))
+    output = stack.run(steps)
+    assert calls == Counter({'crop': 1, 'gamma': 1, 'threshold': 1})
+
+    assert stack.run(steps) is output
+    assert stack.run(steps[:2]) is stack.outputs[steps[:2]]
+    assert calls == Counter({'crop': 1, 'gamma': 1, 'threshold': 1})
+
+# A longer state only runs the steps after its cached prefix
+def test_push_runs_only_new_steps(image, calls):
+    stack = segmented_stack(image)
+    calls.clear()
+    stack.push(step('window_level', low=10, high=200))
+    assert calls == Counter({'window_level': 1})
+
+def test_outputs_are_read_only(image):
+    stack = segmented_stack(image)
+    assert all(not output.flags.writeable for output in stack.outputs.values())
+    with pytest.raises(ValueError):
+        stack.output()[0, 0] = 1
+
+def test_undo_redo_switch_to_cached_outputs(image, calls):
+    stack = segmented_stack(image)
+    segmented = stack.output()
+    windowed = stack.push(step('window_level', low=10, high=200))
+    calls.clear()
+
+    assert stack.undo()
+    assert stack.output() is segmented
+    assert stack.undo()
+    assert stack.output() is image
+    assert not stack.undo()
+
+    assert stack.redo()
+    assert stack.output() is segmented
+    assert stack.redo()
+    assert stack.output() is windowed
+    assert not stack.redo()
+    assert not calls
+
+def test_replace_runs_only_later_steps(image, calls):
+    stack = segmented_stack(image)
+    cropped = stack.outputs[stack.steps[:1]]
+    calls.clear()
+
+    stack.replace(1, step('gamma', value=1.2))
+    assert calls == Counter({'gamma': 1, 'threshold': 1})
+    assert stack.outputs[stack.steps[:1]] is cropped
+    assert stack.steps[1] == step('gamma', value=1.2)
+
+# A new windowing replaces the last one, so the levels are not clipped twice
+def test_push_or_replace_replaces_window_level(image):
+    stack = segmented_stack(image)
+    segmented = stack.output()
+    stack.push_or_replace(step('window_level', low=10, high=200))
+    stack.push_or_replace(step('window_level', low=50, high=100))
+
+    assert len(stack.steps) == 4
+    assert stack.below('window_level') is segmented
+    np.testing.assert_array_equal(stack.output(), np.clip(segmented, 50, 100))
+
+    assert stack.undo()
+    assert stack.steps[-1] == step('window_level', low=10, high=200)
+
+def test_same_state_is_not_a_change(image):
+    stack = segmented_stack(image)
+    stack.push()
+    stack.replace(1, step('gamma', value=0.8))
+    assert stack.undo_states == [()]
+
+# Outputs of states that can no longer be reached with undo or redo are dropped
+def test_forget_drops_unreachable_outputs(image):
+    stack = segmented_stack(image)
+    windowed_steps = stack.steps + (step('window_level', low=10, high=200),)
+    stack.push(windowed_steps[-1])
+    assert stack.undo()
+
+    stack.push(step('window_level', low=50, high=100))
+    assert stack.redo_states == []
+    assert windowed_steps not in stack.outputs
+    assert stack.steps[:3] in stack.outputs
+
+def test_history_limits_undo(image):
+    stack = ProcessingStack(image, history=3)
+    for low in range(1, 6):
+        stack.push_or_replace(step('window_level', low=low, high=200))
+    assert len(stack.undo_states) == 3
+    assert sum(stack.undo() for _ in range(5)) == 3
+    assert stack.steps == (step('window_level', low=2, high=200),)
+    assert len(stack.outputs) == 5
+
+def test_clear_can_be_undone(image):
+    stack = segmented_stack(image)
+    segmented = stack.output()
+    assert stack.clear() is image
+    assert stack.undo()
+    assert stack.output() is segmented
+
+def test_unknown_operation():
+    with pytest.raises(ValueError):
+        step('blur', size=3)
+
+# The steps of the segmentation give the bytes of segment_image_reference on both branches
+#
+# A dark breast only brings the gamma below 0.6 on a canvas large enough for
+# the fixed size circles of synthetic_mammogram.
+@pytest.mark.parametrize('size, brightness, otsu', [((240, 180), 230, True), ((960, 720), 40, False)])
+def test_segmentation_steps_match_reference(size, brightness, otsu):
+    image = freeze(synthetic_mammogram(*size, brightness=brightness))
+    assert (optimal_gamma(image) >= 0.6) == otsu
+
+    steps = segmentation_steps(image)
+    assert (step('threshold') in steps) == otsu
+    output = ProcessingStack(image).push(*steps)
+    assert output.tobytes() == segment_image_reference(image).tobytes()
+
+# Segmenting after another step uses that step as the source of the largest component
+def test_segmentation_steps_after_other_steps(image):
+    stack = ProcessingStack(image)
+    stack.push(step('window_level', low=0, high=255))
+    output = stack.push(*segmentation_steps(stack.output(), len(stack.steps)))
+    assert output.tobytes() == segment_image_reference(image).tobytes()
@@ -0,0 +1,47 @@
+# Daniel Vitor de Oliveira Santos, 716417, Ciência da Computação Coração Eucarístico
+# Guilherme Cosso Lima Pimenta, gclpimenta@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+# Larissa Kaweski Siqueira, larissa.kaweski@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+import numpy as np
+import pytest
+
+pytest.importorskip('PyQt5.QtGui')
+
+from PyQt5.QtGui import QImage
+from qimage_bridge import array_to_qimage
+
+# Gray level of every pixel of a QImage, read through Qt
+def qimage_pixels(qimage):
+    return np.array([[qimage.pixelColor(x, y).red() for x in range(qimage.width())] for y in range(qimage.height())])
+
+def test_qimage_uses_the_array_memory():
+    image = np.arange(12 * 10, dtype=np.uint8).reshape(12, 10)
+    qimage = array_to_qimage(image)
+    assert qimage.format() == QImage.Format_Grayscale8
+    assert qimage.array is image
+    assert int(qimage.constBits()) == image.ctypes.data
+    np.testing.assert_array_equal(qimage_pixels(qimage), image)
+
+    # The QImage shows the array as it changes
+    image[3, 4] = 7
+    assert qimage.pixelColor(4, 3).red() == 7
+
+# A cropped view keeps the stride of its rows, without a copy
+def test_cropped_view_is_not_copied():
+    image = np.arange(20 * 30, dtype=np.uint8).reshape(20, 30)
+    view = image[5:15, 7:20]
+    qimage = array_to_qimage(view)
+    assert qimage.bytesPerLine() == 30
+    assert int(qimage.constBits()) == view.ctypes.data
+    np.testing.assert_array_equal(qimage_pixels(qimage), view)
+
+def test_rows_that_are_not_contiguous_are_copied():
+    image = np.arange(20 * 30, dtype=np.uint8).reshape(20, 30)
+    view = image[:, ::2]
+    qimage = array_to_qimage(view)
+    assert qimage.array is not view
+    np.testing.assert_array_equal(qimage_pixels(qimage), view)
+
+@pytest.mark.parametrize('image', [np.zeros((4, 4), dtype=np.uint16), np.zeros((4, 4, 4), dtype=np.uint8)])
+def test_only_8bit_gray_arrays(image):
+    with pytest.raises(ValueError):
+        array_to_qimage(image)
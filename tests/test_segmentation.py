@@ -0,0 +1,124 @@
+# Daniel Vitor de Oliveira Santos, 716417, Ciência da Computação Coração Eucarístico
+# Guilherme Cosso Lima Pimenta, gclpimenta@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+# Larissa Kaweski Siqueira, larissa.kaweski@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+import numpy as np
+import pytest
+
+from benchmark_segmentation import benchmark_scales, synthetic_mammogram
+from segmentation import GammaLUTCache, SegmentationEngine, find_optimal_gamma, gamma_lut, mask_iou, segment_image_reference
+
+# Synthetic mammograms that take each branch of the segmentation
+#
+# The circles of synthetic_mammogram have a fixed size, so a dark breast only
+# brings the mean below the 0.6 gamma cutoff on a large canvas.
+OTSU_BRIGHTNESS = 230
+FIXED_BRIGHTNESS = 40
+SIZES = {OTSU_BRIGHTNESS: (480, 360), FIXED_BRIGHTNESS: (960, 720)}
+
+# Synthetic mammogram, checking that its gamma takes the expected branch
+def mammogram(brightness, seed=42, size=None):
+    height, width = size or SIZES[brightness]
+    image = synthetic_mammogram(height, width, brightness, seed)
+    gamma = find_optimal_gamma(image)
+    if brightness == OTSU_BRIGHTNESS:
+        assert gamma >= 0.6
+    else:
+        assert gamma < 0.6
+    return image
+
+@pytest.mark.parametrize('brightness', [OTSU_BRIGHTNESS, FIXED_BRIGHTNESS])
+def test_engine_is_identical_to_reference(brightness):
+    image = mammogram(brightness)
+    result = SegmentationEngine().segment(image)
+    expected = segment_image_reference(image)
+    assert result.dtype == expected.dtype and result.shape == expected.shape
+    assert result.tobytes() == expected.tobytes()
+
+# The buffers of an engine are reused between images, also of other sizes
+def test_engine_reuses_buffers_between_images():
+    engine = SegmentationEngine()
+    images = [mammogram(OTSU_BRIGHTNESS), mammogram(FIXED_BRIGHTNESS),
+              mammogram(OTSU_BRIGHTNESS, seed=7, size=(400, 300)), mammogram(OTSU_BRIGHTNESS)]
+    for image in images:
+        assert engine.segment(image).tobytes() == segment_image_reference(image).tobytes()
+
+def test_engine_writes_into_out():
+    image = mammogram(OTSU_BRIGHTNESS)
+    expected = segment_image_reference(image)
+    out = np.empty(expected.shape, dtype=np.uint8)
+    assert SegmentationEngine().segment(image, out=out) is out
+    assert out.tobytes() == expected.tobytes()
+
+# Segmenting the same image again takes the table from the cache and gives the same bytes
+def test_cached_gamma_table_keeps_reference():
+    image = mammogram(OTSU_BRIGHTNESS)
+    engine = SegmentationEngine(GammaLUTCache())
+    first = engine.segment(image).copy()
+    second = engine.segment(image)
+    assert engine.lut_cache.stats()['hits'] == 1
+    assert first.tobytes() == second.tobytes() == segment_image_reference(image).tobytes()
+
+# The fixed threshold branch is never reduced, so it stays identical with a mask scale
+def test_scaled_engine_keeps_fixed_threshold_branch():
+    image = mammogram(FIXED_BRIGHTNESS)
+    assert SegmentationEngine(scale=4).segment(image).tobytes() == segment_image_reference(image).tobytes()
+
+def test_engine_rejects_scale_below_one():
+    with pytest.raises(ValueError):
+        SegmentationEngine(scale=0)
+
+# Gammas closer than the precision share a table, the table of the rounded gamma
+def test_lut_cache_quantized_key():
+    cache = GammaLUTCache(precision=0.01)
+    table = cache.get(0.7012)
+    assert cache.get(0.6987) is table
+    assert cache.get(0.7112) is not table
+    assert cache.quantize(0.7012) == pytest.approx(0.70)
+    np.testing.assert_array_equal(table, gamma_lut(0.70))
+
+def test_lut_cache_exact_key():
+    cache = GammaLUTCache()
+    assert cache.get(0.7012) is not cache.get(0.7013)
+    np.testing.assert_array_equal(cache.get(0.7012), gamma_lut(0.7012))
+
+# The table used least recently is the one evicted
+def test_lut_cache_evicts_least_recently_used():
+    cache = GammaLUTCache(precision=0.1, maxsize=2)
+    first = cache.get(0.6)
+    cache.get(0.7)
+    assert cache.get(0.6) is first
+    cache.get(0.8)
+    assert cache.stats()['size'] == 2
+    assert cache.get(0.6) is first
+    assert cache.stats()['misses'] == 3
+    cache.get(0.7)
+    assert cache.stats()['misses'] == 4
+
+def test_lut_cache_counts_hits_and_misses():
+    cache = GammaLUTCache(precision=0.01)
+    for gamma in (0.70, 0.701, 0.72, 0.699, 0.72):
+        cache.get(gamma)
+    assert cache.stats() == {'hits': 3, 'misses': 2, 'size': 2, 'hit_rate': 0.6}
+
+# segment takes one table per image from the cache, the first segmentation of an image is a miss
+def test_engine_gets_one_table_per_image():
+    engine = SegmentationEngine(GammaLUTCache(precision=0.001))
+    images = [mammogram(OTSU_BRIGHTNESS, seed=seed) for seed in (1, 2, 1)]
+    for image in images:
+        engine.segment(image)
+    stats = engine.lut_cache.stats()
+    assert stats['hits'] + stats['misses'] == 3
+    assert stats['hits'] >= 1
+
+# The Otsu branch computed on a reduced image stays close to the full resolution mask
+@pytest.mark.parametrize('scale', [4, 8])
+def test_scaled_mask_of_otsu_branch(scale):
+    image = mammogram(OTSU_BRIGHTNESS, size=(960, 720))
+    full = SegmentationEngine().compute_mask(image)[1].copy()
+    reduced = SegmentationEngine(scale=scale).compute_mask(image)[1]
+    assert not np.array_equal(reduced, full)
+    assert mask_iou(reduced, full) > 0.98
+
+def test_benchmark_scales_needs_otsu_branch():
+    with pytest.raises(ValueError):
+        benchmark_scales(960, 720, FIXED_BRIGHTNESS, [4], repeats=1)
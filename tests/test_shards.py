@@ -0,0 +1,93 @@
+# Daniel Vitor de Oliveira Santos, 716417, Ciência da Computação Coração Eucarístico
+# Guilherme Cosso Lima Pimenta, gclpimenta@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+# Larissa Kaweski Siqueira, larissa.kaweski@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+import os
+import cv2
+import numpy as np
+import pytest
+
+pytest.importorskip('tensorflow')
+
+import shards
+from preprocessing import get_dataset
+from shards import export_shard, read_description, read_shard, shard_files
+
+# Dataset of small images in two label folders, each image filled with its number
+@pytest.fixture
+def dataset(tmp_path):
+    for number in range(1, 7):
+        label = 'I' if number % 2 else 'II'
+        os.makedirs(tmp_path / 'images' / label, exist_ok=True)
+        image = np.full((40, 30), number * 10, dtype=np.uint8)
+        cv2.imencode('.png', image)[1].tofile(str(tmp_path / 'images' / label / f'image ({number}).png'))
+    return get_dataset(tmp_path / 'images').sort_values('Filepath').reset_index(drop=True)
+
+# Labels and first pixel of every image of a shard, in the order of the shard
+def shard_contents(prefix):
+    images, labels, class_names = read_shard(prefix)
+    return [(class_names[label], int(image[0, 0])) for image, label in zip(images, labels)]
+
+# Labels and first pixel expected for the rows
+def row_contents(rows):
+    return [(label, int(os.path.basename(path).split('(')[1].split(')')[0]) * 10)
+            for path, label in zip(rows['Filepath'], rows['Label'])]
+
+def test_export_follows_the_rows(dataset, tmp_path):
+    prefix = str(tmp_path / 'shards' / 'train')
+    export_shard(dataset, prefix, image_size=16)
+    assert shard_contents(prefix) == row_contents(dataset)
+    assert read_description(prefix)['order'] == [[path, ''] for path in dataset['Filepath']]
+
+def test_same_rows_are_kept(dataset, tmp_path, capsys):
+    prefix = str(tmp_path / 'train')
+    export_shard(dataset, prefix, image_size=16)
+    times = [os.stat(path).st_mtime_ns for path in shard_files(prefix)]
+    capsys.readouterr()
+
+    export_shard(dataset, prefix, image_size=16)
+    assert 'already packed' in capsys.readouterr().out
+    assert [os.stat(path).st_mtime_ns for path in shard_files(prefix)] == times
+
+# The same rows in another order are packed again, the labels follow the new order
+def test_reordered_rows_are_packed_again(dataset, tmp_path, capsys):
+    prefix = str(tmp_path / 'train')
+    export_shard(dataset, prefix, image_size=16)
+    capsys.readouterr()
+
+    reordered = dataset.sample(frac=1, random_state=1).reset_index(drop=True)
+    export_shard(reordered, prefix, image_size=16)
+    assert 'already packed' not in capsys.readouterr().out
+    assert shard_contents(prefix) == row_contents(reordered)
+
+# An export stopped after the images were replaced leaves no description, so the next one packs again
+def test_stopped_export_is_not_kept(dataset, tmp_path, monkeypatch, capsys):
+    prefix = str(tmp_path / 'train')
+    export_shard(dataset, prefix, image_size=16)
+    reordered = dataset.sample(frac=1, random_state=1).reset_index(drop=True)
+
+    def stop(path, data):
+        raise KeyboardInterrupt
+    monkeypatch.setattr(shards, 'write_atomic', stop)
+    with pytest.raises(KeyboardInterrupt):
+        export_shard(reordered, prefix, image_size=16)
+    assert read_description(prefix) is None
+
+    monkeypatch.undo()
+    capsys.readouterr()
+    export_shard(reordered, prefix, image_size=16)
+    assert 'already packed' not in capsys.readouterr().out
+    assert shard_contents(prefix) == row_contents(reordered)
+
+def test_augmented_rows(dataset, tmp_path):
+    from augmentation import augmented_dataset, load_variants
+
+    rows = augmented_dataset(dataset)
+    prefix = str(tmp_path / 'train')
+    export_shard(rows, prefix, image_size=16)
+    images, labels, class_names = read_shard(prefix)
+    assert images.shape == (len(rows), 16, 16)
+    for position in (0, 5, 23):
+        path = rows['Filepath'][position]
+        variant = shards.VARIANTS.index(rows['Variant'][position])
+        np.testing.assert_array_equal(images[position], load_variants(path, 16)[variant])
+        assert class_names[labels[position]] == rows['Label'][position]
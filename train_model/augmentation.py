@@ -0,0 +1,53 @@
+# Daniel Vitor de Oliveira Santos, 716417, Ciência da Computação Coração Eucarístico
+# Guilherme Cosso Lima Pimenta, gclpimenta@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+# Larissa Kaweski Siqueira, larissa.kaweski@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+import cv2
+import numpy as np
+
+from preprocessing import read_image
+
+# Variants of each training image, in the order of the files written by aumentar_dados
+VARIANTS = ['original', 'espelhada', 'equalizada', 'espelhada_equalizada']
+
+# One row per image and variant, the same rows get_dataset gives for images_train_segmented_increased
+#
+# Filepath stays the segmented image and the Variant column says which copy the
+# row stands for, so shuffling and train_test_split see the same rows as
+# before and the class balance and the split do not change.
+def augmented_dataset(dataset):
+    rows = dataset[['Filepath', 'Label']].loc[dataset.index.repeat(len(VARIANTS))].reset_index(drop=True)
+    rows['Variant'] = VARIANTS * len(dataset)
+    return rows
+
+# The 4 variants of an image, reading it once
+#
+# The equalization only depends on the histogram, which the flip does not
+# change, so the flipped equalized image is the flip of the equalized one and
+# cv2.equalizeHist runs once. The images are resized before flipping, so the
+# flips are done on the small images. Resizing uses nearest neighbour, like
+# flow_from_dataframe.
+def load_variants(path, image_size=None):
+    image = read_image(str(path))[0]
+    equalized = cv2.equalizeHist(image)
+    if image_size is not None:
+        image = cv2.resize(image, (image_size, image_size), interpolation=cv2.INTER_NEAREST)
+        equalized = cv2.resize(equalized, (image_size, image_size), interpolation=cv2.INTER_NEAREST)
+    return np.stack([image, cv2.flip(image, 1), equalized, cv2.flip(equalized, 1)])
+
+# Grayscale images and labels as a RGB batch in [0, 1] and one-hot labels
+def to_batch(images, labels, num_classes):
+    batch = np.repeat(np.stack(images)[..., np.newaxis], 3, axis=-1).astype(np.float32) / 255.0
+    return batch, np.eye(num_classes, dtype=np.float32)[labels]
+
+# Show the variants of an image
+def display_variants(path):
+    import matplotlib.pyplot as plt
+
+    fig, axs = plt.subplots(1, 4, figsize=(15, 5))
+    titles = ["Original Segmented", "Flipped", "Equalized", "Flipped Equalized"]
+    for ax, image, title in zip(axs, load_variants(path), titles):
+        ax.imshow(image, cmap='gray')
+        ax.set_title(title)
+
+    plt.tight_layout()
+    plt.show()
@@ -0,0 +1,127 @@
+# Daniel Vitor de Oliveira Santos, 716417, Ciência da Computação Coração Eucarístico
+# Guilherme Cosso Lima Pimenta, gclpimenta@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+# Larissa Kaweski Siqueira, larissa.kaweski@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+import sys
+import time
+import argparse
+import numpy as np
+import tensorflow as tf
+
+from preprocessing import get_dataset, map_label
+
+# Class names in alphabetical order, the class indices flow_from_dataframe uses
+def class_names_of(dataframe):
+    return sorted(dataframe['Label'].unique())
+
+# Split like ImageDataGenerator(validation_split=...): the first rows are the validation subset
+def split_validation(dataframe, validation_split):
+    split = int(len(dataframe) * validation_split)
+    return dataframe.iloc[split:], dataframe.iloc[:split]
+
+# Read a PNG as a grayscale image of image_size x image_size, still uint8
+#
+# Nearest neighbour, like flow_from_dataframe, and one channel so the cache
+# holds a third of the bytes of the RGB images.
+def decode_image(path, image_size=224):
+    image = tf.io.decode_png(tf.io.read_file(path), channels=1)
+    image = tf.image.resize(image, (image_size, image_size), method='nearest')
+    image.set_shape((image_size, image_size, 1))
+    return image
+
+# RGB in [0, 1], like ImageDataGenerator(rescale=1./255) with color_mode="rgb", on a whole batch
+def normalize(images, labels):
+    return tf.image.grayscale_to_rgb(tf.cast(images, tf.float32) / 255.0), labels
+
+# tf.data replacement of ImageDataGenerator(rescale=1./255).flow_from_dataframe
+#
+# The PNGs are decoded and resized in parallel, and the uint8 images are kept by
+# cache() (in memory, or in a file when cache is a path), so only the first
+# epoch reads the disk. Shuffling happens after the cache, every epoch gets a
+# new order, and batches are normalized and prefetched while the model runs.
+def image_dataset(dataframe, class_names=None, image_size=224, batch_size=32, shuffle=True, seed=42, cache=True):
+    class_names = class_names or class_names_of(dataframe)
+    paths = dataframe['Filepath'].astype(str).values
+    labels = np.eye(len(class_names), dtype=np.float32)[[class_names.index(label) for label in dataframe['Label']]]
+
+    dataset = tf.data.Dataset.from_tensor_slices((paths, labels))
+    dataset = dataset.map(lambda path, label: (decode_image(path, image_size), label),
+                          num_parallel_calls=tf.data.AUTOTUNE)
+    if cache:
+        dataset = dataset.cache() if cache is True else dataset.cache(cache)
+    if shuffle:
+        dataset = dataset.shuffle(len(paths), seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.batch(batch_size).map(normalize, num_parallel_calls=tf.data.AUTOTUNE)
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+# Time to go through every batch of a loader once
+def epoch_time(batches):
+    start_time = time.perf_counter()
+    count = 0
+    for images, _ in batches:
+        count += len(images)
+    return time.perf_counter() - start_time, count
+
+# Compare the time of an epoch of flow_from_dataframe with the tf.data pipeline on the same images
+def compare_epoch_time(dataframe, epochs=3, image_size=224, batch_size=32):
+    from tensorflow.keras.preprocessing.image import ImageDataGenerator
+
+    generator = ImageDataGenerator(rescale=1./255).flow_from_dataframe(
+        dataframe=dataframe,
+        x_col="Filepath",
+        y_col="Label",
+        target_size=(image_size, image_size),
+        batch_size=batch_size,
+        class_mode="categorical",
+        color_mode="rgb",
+        shuffle=True,
+        seed=42
+    )
+    dataset = image_dataset(dataframe, image_size=image_size, batch_size=batch_size)
+
+    results = {'flow_from_dataframe': [], 'tf.data': []}
+    for epoch in range(epochs):
+        seconds, count = epoch_time(generator[i] for i in range(len(generator)))
+        results['flow_from_dataframe'].append(seconds)
+        print(f'flow_from_dataframe, epoch {epoch + 1}: {round(seconds, 2)}s ({round(count / seconds, 1)} images/s)')
+
+        # The first epoch also fills the cache
+        seconds, count = epoch_time(dataset)
+        results['tf.data'].append(seconds)
+        print(f'tf.data, epoch {epoch + 1}: {round(seconds, 2)}s ({round(count / seconds, 1)} images/s)')
+
+    # The same images in the same order must give the same batch
+    generator = ImageDataGenerator(rescale=1./255).flow_from_dataframe(
+        dataframe=dataframe, x_col="Filepath", y_col="Label", target_size=(image_size, image_size),
+        batch_size=batch_size, class_mode="categorical", color_mode="rgb", shuffle=False
+    )
+    expected_images, expected_labels = generator[0]
+    images, labels = next(iter(image_dataset(dataframe, image_size=image_size, batch_size=batch_size,
+                                             shuffle=False, cache=False)))
+    difference = float(np.max(np.abs(images.numpy() - expected_images)))
+    print(f'first batch: max pixel difference {round(difference, 4)}, '
+          f'same labels: {np.array_equal(labels.numpy(), expected_labels)}')
+
+    generator_time = np.mean(results['flow_from_dataframe'][1:] or results['flow_from_dataframe'])
+    dataset_time = np.mean(results['tf.data'][1:] or results['tf.data'])
+    print(f'after the first epoch: {round(generator_time, 2)}s -> {round(dataset_time, 2)}s per epoch '
+          f'({round(generator_time / dataset_time, 2)}x)')
+    return results
+
+# Read the command line options
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Compare the epoch time of flow_from_dataframe and tf.data.')
+    parser.add_argument('--images', default='images_segmented_label', help='folder with the images, one folder per label')
+    parser.add_argument('--epochs', type=int, default=3)
+    parser.add_argument('--batch-size', type=int, default=32)
+    return parser.parse_args(argv)
+
+# Main function
+def main(argv=None):
+    args = parse_args(argv)
+    dataset = get_dataset(args.images)
+    dataset['Label'] = dataset['Label'].apply(map_label)
+    compare_epoch_time(dataset, args.epochs, batch_size=args.batch_size)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,121 @@
+# Daniel Vitor de Oliveira Santos, 716417, Ciência da Computação Coração Eucarístico
+# Guilherme Cosso Lima Pimenta, gclpimenta@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+# Larissa Kaweski Siqueira, larissa.kaweski@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+import io
+import os
+import time
+import numpy as np
+
+# preprocessing puts src/ in the path, the metrics are the same the application reports
+from preprocessing import write_atomic
+from engines import weights_fingerprint
+from metrics import compute_metrics, format_metrics
+from shards import ShardSequence, read_description
+
+# Predictions of a model on a test set, computed once, with every metric of the notebooks
+class Evaluation:
+    def __init__(self, probabilities, labels, class_names, filenames=None):
+        self.probabilities = probabilities
+        self.labels = labels
+        self.class_names = list(class_names)
+        self.filenames = filenames
+        self.predicted = np.argmax(probabilities, axis=1)
+        self.metrics = compute_metrics(labels, self.predicted, len(self.class_names))
+
+    # Accuracy, precision, recall, mean specificity and F1, in the format of the notebooks
+    def report(self):
+        return format_metrics(self.metrics)
+
+    # Categorical cross-entropy of the predictions, like the loss of Model.evaluate
+    def loss(self):
+        probabilities = np.clip(self.probabilities[np.arange(len(self.labels)), self.labels], 1e-7, 1.0)
+        return float(-np.mean(np.log(probabilities)))
+
+    def confusion_matrix(self):
+        return self.metrics['confusion_matrix']
+
+    # Precision, recall and F1 of each class, like sklearn classification_report
+    def classification_report(self, digits=4):
+        from sklearn.metrics import classification_report
+        return classification_report(self.labels, self.predicted, labels=list(range(len(self.class_names))),
+                                     target_names=self.class_names, digits=digits, zero_division=0)
+
+    # Plot the confusion matrix, with the count of each cell
+    def plot_confusion_matrix(self):
+        import matplotlib.pyplot as plt
+
+        cm = self.confusion_matrix()
+        plt.imshow(cm, interpolation='nearest', cmap=plt.cm.Blues)
+        plt.colorbar()
+
+        # Definir os rótulos dos eixos
+        plt.xlabel('Classe Predita')
+        plt.ylabel('Classe Verdadeira')
+
+        # Definir os rótulos das classes
+        tick_marks = np.arange(len(self.class_names))
+        plt.xticks(tick_marks, self.class_names, rotation=45)
+        plt.yticks(tick_marks, self.class_names)
+
+        # Preencher a matriz com os valores
+        thresh = cm.max() / 2.
+        for i in range(cm.shape[0]):
+            for j in range(cm.shape[1]):
+                plt.text(j, i, format(cm[i, j], 'd'),
+                         ha="center", va="center",
+                         color="white" if cm[i, j] > thresh else "black")
+        plt.show()
+
+# Batches, true labels, class names and file names of a test set
+#
+# The test set is a shard prefix or a flow_from_dataframe iterator created
+# with shuffle=False, whose classes are in the order of its batches.
+def test_set(data, batch_size=32):
+    if isinstance(data, str):
+        sequence = ShardSequence(data, batch_size)
+        filenames = [path for path, _ in read_description(data).get('order', [])]
+        return sequence, sequence.labels, sequence.class_names, filenames
+    if getattr(data, 'shuffle', False):
+        raise ValueError('the test generator must be created with shuffle=False')
+    class_names = sorted(data.class_indices, key=data.class_indices.get)
+    return data, np.asarray(data.classes), class_names, list(data.filenames)
+
+# Read the predictions saved for the same model and test set, None if there are none
+def read_predictions(path, fingerprint, labels):
+    if path is None or not os.path.exists(path):
+        return None
+    with np.load(path) as saved:
+        if str(saved['fingerprint']) != fingerprint or not np.array_equal(saved['labels'], labels):
+            return None
+        return saved['probabilities']
+
+# Save the predictions with the labels and the fingerprint of the model
+def write_predictions(path, fingerprint, probabilities, labels, class_names, filenames):
+    buffer = io.BytesIO()
+    np.savez(buffer, fingerprint=fingerprint, probabilities=probabilities, labels=labels,
+             class_names=np.array(class_names), filenames=np.array(filenames))
+    write_atomic(path, buffer.getvalue())
+
+# Evaluate a model on a test set with a single pass of inference
+#
+# The outputs of the model are saved in cache_path with the true labels and a
+# fingerprint of the weights, so running the evaluation again with the same
+# model and test set does not run the model at all. Every metric, the
+# classification report and the confusion matrix plot come from these outputs.
+def evaluate(model, data, cache_path=None, batch_size=32):
+    batches, labels, class_names, filenames = test_set(data, batch_size)
+    fingerprint = weights_fingerprint(model)
+    probabilities = read_predictions(cache_path, fingerprint, labels)
+    if probabilities is None:
+        start_time = time.perf_counter()
+        probabilities = model.predict(batches, verbose=0)
+        print(f'{len(labels)} test images predicted in {round(time.perf_counter() - start_time, 2)}s')
+        if cache_path is not None:
+            write_predictions(cache_path, fingerprint, probabilities, labels, class_names, filenames)
+    return Evaluation(probabilities, labels, class_names, filenames)
+
+# Evaluation from predictions saved by evaluate, without the model
+def load_evaluation(cache_path):
+    with np.load(cache_path) as saved:
+        return Evaluation(saved['probabilities'], saved['labels'], saved['class_names'].tolist(),
+                          saved['filenames'].tolist())
@@ -0,0 +1,175 @@
+# Daniel Vitor de Oliveira Santos, 716417, Ciência da Computação Coração Eucarístico
+# Guilherme Cosso Lima Pimenta, gclpimenta@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+# Larissa Kaweski Siqueira, larissa.kaweski@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.models import Sequential
+from tensorflow.keras.layers import Dense, Flatten, Dropout, BatchNormalization, InputLayer
+from tensorflow.keras.optimizers import SGD
+from tensorflow.keras.optimizers.schedules import InverseTimeDecay
+from tensorflow.keras.callbacks import ModelCheckpoint
+
+# preprocessing puts src/ in the path, for the fingerprint of the weights used by the application
+from preprocessing import write_atomic
+from engines import weights_fingerprint
+from shards import ShardSequence, read_description, read_shard
+
+# Files of the features of a shard: float16 embeddings and the description of the rows
+def feature_files(prefix):
+    return prefix + '.features.npy', prefix + '.features.json'
+
+# Metric the head is compiled with, the best epoch is the one with the best validation value of it
+METRIC = 'acc'
+
+# Compute the pooled backbone features of every image of a shard, once
+#
+# The backbone is frozen, so the features of an image and variant never change
+# while the weights are the same. They are written as float16 through a memory
+# map (N x 2048, 4 KB per image) next to the shard, in the order of its rows,
+# and computed again only when the description of the shard (its rows, their
+# order and the classes) or the weights of the backbone change.
+def build_features(prefix, backbone, batch_size=64):
+    features_path, description_path = feature_files(prefix)
+    description = {'shard': read_description(prefix), 'backbone': weights_fingerprint(backbone)}
+    if os.path.exists(features_path) and os.path.exists(description_path):
+        with open(description_path, encoding='utf-8') as file:
+            if json.load(file) == description:
+                print(f'{prefix}: features already computed')
+                return np.load(features_path, mmap_mode='r')
+
+    sequence = ShardSequence(prefix, batch_size)
+    size = int(np.prod(backbone.output_shape[1:]))
+    temp_path = features_path + '.tmp'
+    features = np.lib.format.open_memmap(temp_path, mode='w+', dtype=np.float16, shape=(len(sequence.labels), size))
+
+    @tf.function
+    def embed(batch):
+        return backbone(batch, training=False)
+
+    start_time = time.perf_counter()
+    for index in range(len(sequence)):
+        images, _ = sequence[index]
+        features[index * batch_size:index * batch_size + len(images)] = embed(images).numpy().reshape(len(images), -1)
+    features.flush()
+    del features
+    os.replace(temp_path, features_path)
+    write_atomic(description_path, json.dumps(description).encode('utf-8'))
+
+    elapsed_time = time.perf_counter() - start_time
+    print(f'{prefix}: features of {len(sequence.labels)} images in {round(elapsed_time, 2)}s')
+    return np.load(features_path, mmap_mode='r')
+
+# Batches of the features of a shard for Model.fit
+#
+# The features stay a float16 memory map, only the rows of each batch are read
+# and converted to float32. With shuffle the rows are shuffled every epoch, and
+# the rows of a batch are read in increasing order.
+class FeatureSequence(tf.keras.utils.Sequence):
+    def __init__(self, features, labels, num_classes, batch_size=32, shuffle=False, seed=42):
+        super().__init__()
+        self.features = features
+        self.labels = np.eye(num_classes, dtype=np.float32)[labels]
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.random = np.random.default_rng(seed)
+        self.order = np.arange(len(self.labels))
+        self.on_epoch_end()
+
+    def __len__(self):
+        return (len(self.labels) + self.batch_size - 1) // self.batch_size
+
+    def __getitem__(self, index):
+        rows = np.sort(self.order[index * self.batch_size:(index + 1) * self.batch_size])
+        return self.features[rows].astype(np.float32), self.labels[rows]
+
+    def on_epoch_end(self):
+        if self.shuffle:
+            self.random.shuffle(self.order)
+
+# Batches of the features and one-hot labels of a shard
+def load_features(prefix, backbone, batch_size=32, shuffle=False):
+    features = build_features(prefix, backbone)
+    _, labels, class_names = read_shard(prefix)
+    return FeatureSequence(features, labels, len(class_names), batch_size, shuffle)
+
+# Layers that convolutional_model puts after the backbone, on the features
+def head_model(num_classes, input_size=2048):
+    model = Sequential()
+    model.add(InputLayer(input_shape=(input_size,)))
+    model.add(Dropout(0.2))
+    model.add(Flatten())
+    model.add(Dense(256, activation='relu'))
+    model.add(Dropout(0.2))
+    model.add(BatchNormalization())
+    model.add(Dense(256, activation='relu'))
+    model.add(Dropout(0.2))
+    model.add(BatchNormalization())
+    model.add(Dense(256, activation='relu'))
+    model.add(Dropout(0.2))
+    model.add(BatchNormalization())
+    model.add(Dense(num_classes, activation='softmax'))
+
+    # Same optimizer as the notebooks, SGD(lr=0.01, decay=1e-6) as a schedule
+    opt = SGD(learning_rate=InverseTimeDecay(0.01, decay_steps=1, decay_rate=1e-6), momentum=0.9, nesterov=True)
+    model.compile(optimizer=opt, loss='categorical_crossentropy', metrics=[METRIC])
+    return model
+
+# Train the head on the features of the train and validation shards, keeping the best epoch
+#
+# Returns the head with the weights of the best epoch and the history of the training.
+def train_head(train_prefix, validation_prefix, backbone, epochs=30, batch_size=32, checkpoint=None):
+    train = load_features(train_prefix, backbone, batch_size, shuffle=True)
+    validation = load_features(validation_prefix, backbone, batch_size)
+    head = head_model(train.labels.shape[1], train.features.shape[1])
+
+    checkpoint = checkpoint or train_prefix + '.head.weights.h5'
+    callbacks = [ModelCheckpoint(filepath=checkpoint, save_weights_only=True, monitor='val_' + METRIC,
+                                 save_best_only=True, mode='max')]
+    start_time = time.perf_counter()
+    history = head.fit(train, validation_data=validation, epochs=epochs, callbacks=callbacks)
+    print(f'{epochs} epochs in {round(time.perf_counter() - start_time, 2)}s')
+    head.load_weights(checkpoint)
+    return head, history
+
+# Full model for the application: the backbone followed by the layers of the head
+#
+# Same layers as convolutional_model, so the saved model loads like the models
+# trained end to end, with the backbone as the first layer.
+def attach_head(backbone, head):
+    model = Sequential()
+    model.add(backbone)
+    for layer in head.layers:
+        model.add(layer)
+    model.compile(optimizer=head.optimizer, loss='categorical_crossentropy', metrics=[METRIC])
+    return model
+
+# Read the command line options
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Train the classification head on stored backbone features.')
+    parser.add_argument('--train', default='shards/segmented_4_classes/train', help='prefix of the train shard')
+    parser.add_argument('--validation', default='shards/segmented_4_classes/validation', help='prefix of the validation shard')
+    parser.add_argument('--output', default='best_segmented_4_classes.hdf5', help='full model to save')
+    parser.add_argument('--epochs', type=int, default=30)
+    parser.add_argument('--batch-size', type=int, default=32)
+    return parser.parse_args(argv)
+
+# Main function
+def main(argv=None):
+    from tensorflow.keras.applications import ResNet50
+
+    args = parse_args(argv)
+    backbone = ResNet50(weights='imagenet', pooling='avg', include_top=False, input_shape=(224, 224, 3))
+    backbone.trainable = False
+
+    head, _ = train_head(args.train, args.validation, backbone, args.epochs, args.batch_size)
+    attach_head(backbone, head).save(args.output)
+    print(f'Model saved in {args.output}')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
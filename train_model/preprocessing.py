@@ -0,0 +1,323 @@
+# Daniel Vitor de Oliveira Santos, 716417, Ciência da Computação Coração Eucarístico
+# Guilherme Cosso Lima Pimenta, gclpimenta@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+# Larissa Kaweski Siqueira, larissa.kaweski@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+import os
+import sys
+import json
+import time
+import hashlib
+import inspect
+import argparse
+import tempfile
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+import numpy as np
+import pandas as pd
+
+# Use the segmentation of the application, so the notebooks and the interface segment the same way
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+import segmentation
+from segmentation import default_engine, segment_image, segment_image_reference, set_gamma_precision, set_mask_scale
+
+# File in each output directory with the source and pipeline of every output
+MANIFEST_NAME = 'manifest.json'
+
+# Suffixes of the images written by the data augmentation, in the order of augment_image
+AUGMENTATIONS = ['', '_espelhada', '_equalizada', '_espelhada_equalizada']
+
+# Get all data from a directory and return as a dataframe
+def get_dataset(folder_path):
+    folder = Path(folder_path)
+
+    filepaths = list(folder.glob(r'**/*.png'))
+    labels = list(map(lambda x: os.path.split(os.path.split(x)[0])[1], filepaths))
+
+    filepaths = pd.Series(filepaths, name='Filepath').astype(str)
+    labels = pd.Series(labels, name='Label')
+
+    return pd.concat([filepaths, labels], axis=1)
+
+# Map labels based on initial
+def map_label(label):
+    if label.startswith('D'):
+        return 'I'
+    elif label.startswith('E'):
+        return 'II'
+    elif label.startswith('F'):
+        return 'III'
+    elif label.startswith('G'):
+        return 'IV'
+    else:
+        return label
+
+# Check if is multiple of 4, the test images of the notebooks
+def is_multiple_of_4(number):
+    number = number.split("(")[-1].split(")")[0]
+    number = number.strip()
+    return int(number) % 4 == 0
+
+# Read a grayscale image and the hash of its file, also from paths with non ASCII characters
+def read_image(path):
+    data = np.fromfile(path, dtype=np.uint8)
+    image = cv2.imdecode(data, cv2.IMREAD_GRAYSCALE)
+    if image is None:
+        raise ValueError(f'could not read the image {path}')
+    return image, hashlib.sha1(data).hexdigest()
+
+# Hash of the contents of a file
+def file_hash(path):
+    sha = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+# Write a file atomically, an interrupted run never leaves a truncated file
+def write_atomic(path, data):
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+# Write a PNG atomically
+#
+# cv2.imencode uses the same PNG options as cv2.imwrite, so the file has the
+# same bytes the notebooks wrote.
+def write_image(path, image):
+    ok, data = cv2.imencode('.png', image)
+    if not ok:
+        raise ValueError(f'could not encode the image {path}')
+    write_atomic(path, data.tobytes())
+
+# Original, flipped, equalized and flipped equalized image, like aumentar_dados in the notebooks
+def augment_image(image):
+    flipped = cv2.flip(image, 1)
+    return [image, flipped, cv2.equalizeHist(image), cv2.equalizeHist(flipped)]
+
+# Use the segmentation settings of the parent process in a pool process
+def configure_worker(gamma_precision, mask_scale):
+    set_gamma_precision(gamma_precision)
+    set_mask_scale(mask_scale)
+
+# Segment one image and save it (runs in the process pool)
+def segment_file(job):
+    source, destinations = job
+    try:
+        image, source_hash = read_image(source)
+        write_image(destinations[0], segment_image(image))
+    except Exception as error:
+        return source, None, f'{error.__class__.__name__}: {error}'
+    return source, source_hash, None
+
+# Save the augmented images of one image (runs in the process pool)
+def augment_file(job):
+    source, destinations = job
+    try:
+        image, source_hash = read_image(source)
+        for destination, augmented in zip(destinations, augment_image(image)):
+            write_image(destination, augmented)
+    except Exception as error:
+        return source, None, f'{error.__class__.__name__}: {error}'
+    return source, source_hash, None
+
+# Outputs of an image in each step, in the label folders of the output directory
+def segment_outputs(source, label, output_dir):
+    return [os.path.join(output_dir, label, os.path.basename(source))]
+
+def augment_outputs(source, label, output_dir):
+    name = os.path.basename(source)
+    return [os.path.join(output_dir, label, name.replace('.png', suffix + '.png')) for suffix in AUGMENTATIONS]
+
+# Hash of everything that decides the bytes of the outputs of a step
+#
+# A change to the code of the step, to the segmentation settings or to the
+# OpenCV that encodes the PNGs gives a new version, and every output of the
+# step is written again.
+def pipeline_version(step):
+    sha = hashlib.sha1(f'{step} {cv2.__version__}'.encode())
+    if step == 'segment':
+        engine = default_engine()
+        sha.update(inspect.getsource(segmentation).encode())
+        sha.update(f'{engine.lut_cache.precision} {engine.scale}'.encode())
+    else:
+        sha.update(inspect.getsource(augment_image).encode())
+    return sha.hexdigest()
+
+# Steps of the preprocessing: outputs of an image and function run in the pool
+STEPS = {
+    'segment': (segment_outputs, segment_file),
+    'augment': (augment_outputs, augment_file),
+}
+
+# Read the manifest of an output directory
+def read_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, MANIFEST_NAME), encoding='utf-8') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {'entries': {}}
+
+# Write the manifest of an output directory
+def write_manifest(output_dir, manifest):
+    data = json.dumps(manifest, indent=1, sort_keys=True).encode('utf-8')
+    write_atomic(os.path.join(output_dir, MANIFEST_NAME), data)
+
+# Check if the outputs of an image were made from the same file by the same pipeline
+#
+# The hash of the source is only computed again when its size or modification
+# time changed, so an unchanged dataset is checked without reading it.
+def is_up_to_date(entry, source, outputs, version):
+    if entry is None or entry['pipeline'] != version or entry['outputs'] != outputs:
+        return False
+    if not all(os.path.exists(output) for output in outputs):
+        return False
+
+    stat = os.stat(source)
+    if entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+        return True
+    if entry['size'] != stat.st_size or file_hash(source) != entry['hash']:
+        return False
+
+    # Same contents with a new modification time, like after a copy
+    entry['mtime_ns'] = stat.st_mtime_ns
+    return True
+
+# Remove the outputs that no image of the dataset produces, and temporary files left by a stopped run
+def collect_garbage(output_dir, expected):
+    removed = 0
+    for path in Path(output_dir).glob('**/*'):
+        if path.suffix == '.tmp' or (path.suffix == '.png' and os.path.normpath(path) not in expected):
+            path.unlink()
+            removed += 1
+    return removed
+
+# Build the outputs of a step for every image of the dataset, only the stale ones
+#
+# Each output directory has a manifest with the hash of the source file and the
+# version of the pipeline of every image. Only images that are new, whose file
+# changed or that were made by another pipeline version are processed again,
+# and outputs of images no longer in the dataset are removed. The images are
+# sent to a process pool in chunks, every file is written atomically and the
+# manifest is saved as the images finish, so a stopped run resumes where it
+# stopped.
+def build_outputs(dataset, output_dir, step, workers=None, chunksize=16, force=False, report_every=500):
+    outputs_of, process = STEPS[step]
+    workers = workers or max(1, (os.cpu_count() or 2) - 1)
+    version = pipeline_version(step)
+    os.makedirs(output_dir, exist_ok=True)
+
+    manifest = read_manifest(output_dir)
+    entries = manifest['entries']
+    jobs = {}
+    for source, label in zip(dataset['Filepath'], dataset['Label']):
+        source = os.path.normpath(str(source))
+        jobs[source] = [os.path.normpath(output) for output in outputs_of(source, label, output_dir)]
+
+    # Forget the images no longer in the dataset, and remove their outputs
+    for source in set(entries) - set(jobs):
+        del entries[source]
+    removed = collect_garbage(output_dir, {output for outputs in jobs.values() for output in outputs})
+
+    pending = [(source, outputs) for source, outputs in jobs.items()
+               if force or not is_up_to_date(entries.get(source), source, outputs, version)]
+    for label_dir in {os.path.dirname(output) for _, outputs in pending for output in outputs}:
+        os.makedirs(label_dir, exist_ok=True)
+    print(f'{len(jobs) - len(pending)} of {len(jobs)} images up to date, {len(pending)} to {step}, '
+          f'{removed} orphan files removed')
+
+    failed = []
+    engine = default_engine()
+    settings = (engine.lut_cache.precision, engine.scale)
+    start_time = time.perf_counter()
+    try:
+        if pending:
+            with ProcessPoolExecutor(max_workers=workers, initializer=configure_worker, initargs=settings) as pool:
+                results = pool.map(process, pending, chunksize=chunksize)
+                for count, (source, source_hash, error) in enumerate(results, 1):
+                    if error is not None:
+                        failed.append((source, error))
+                        entries.pop(source, None)
+                    else:
+                        stat = os.stat(source)
+                        entries[source] = {'hash': source_hash, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                                           'pipeline': version, 'outputs': jobs[source]}
+                    if count % report_every == 0:
+                        write_manifest(output_dir, manifest)
+                        elapsed_time = time.perf_counter() - start_time
+                        print(f'{count}/{len(pending)} images, {round(count / elapsed_time, 2)} images/s')
+    finally:
+        write_manifest(output_dir, manifest)
+    elapsed_time = time.perf_counter() - start_time
+
+    for source, error in failed:
+        print(f'{source}: {error}')
+    done = len(pending) - len(failed)
+    rate = done / elapsed_time if elapsed_time > 0 else 0.0
+    print(f'{done} images processed in {round(elapsed_time, 2)}s ({round(rate, 2)} images/s), {len(failed)} failed')
+    return {'total': len(jobs), 'skipped': len(jobs) - len(pending), 'processed': done, 'removed': removed,
+            'failed': failed, 'seconds': elapsed_time, 'images_per_second': rate}
+
+# Segment every image of the dataset, only the new or changed ones
+def segment_dataset(dataset, output_dir='images_segmented_label', workers=None, chunksize=16, force=False):
+    return build_outputs(dataset, output_dir, 'segment', workers, chunksize, force)
+
+# Save the original, flipped, equalized and flipped equalized copies of every image of the dataset
+def augment_dataset(dataset, output_dir='images_train_segmented_increased', workers=None, chunksize=16, force=False):
+    return build_outputs(dataset, output_dir, 'augment', workers, chunksize, force)
+
+# Compare saved images with the original segmentation of the notebooks
+def verify(dataset, output_dir, count=20, seed=42):
+    jobs = [(str(source), segment_outputs(str(source), label, output_dir)[0])
+            for source, label in zip(dataset['Filepath'], dataset['Label'])]
+    random = np.random.default_rng(seed)
+    different = []
+    for index in random.permutation(len(jobs))[:count]:
+        source, destination = jobs[index]
+        ok, expected = cv2.imencode('.png', segment_image_reference(read_image(source)[0]))
+        with open(destination, 'rb') as file:
+            if not ok or file.read() != expected.tobytes():
+                different.append(destination)
+    print(f'{min(count, len(jobs)) - len(different)} of {min(count, len(jobs))} images identical to the reference')
+    return different
+
+# Read the command line options
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Segment or augment the images of the dataset in parallel.')
+    parser.add_argument('step', nargs='?', choices=list(STEPS), default='segment')
+    parser.add_argument('--images', default=None, help='folder with the images, one folder per label '
+                        '(images for segment, images_segmented_label for augment)')
+    parser.add_argument('--output', default=None, help='images_segmented_label for segment, '
+                        'images_train_segmented_increased for augment')
+    parser.add_argument('--workers', type=int, default=None, help='processes working (all cores but one by default)')
+    parser.add_argument('--chunksize', type=int, default=16, help='images sent to a process at a time')
+    parser.add_argument('--force', action='store_true', help='process again the images up to date')
+    parser.add_argument('--verify', type=int, default=0, help='compare this many saved images with the reference')
+    return parser.parse_args(argv)
+
+# Main function
+def main(argv=None):
+    args = parse_args(argv)
+    if args.step == 'augment':
+        # Only the training images are augmented, the multiples of 4 are the test images
+        dataset = get_dataset(args.images or 'images_segmented_label')
+        dataset = dataset[~dataset['Filepath'].apply(is_multiple_of_4)]
+        result = augment_dataset(dataset, args.output or 'images_train_segmented_increased',
+                                 args.workers, args.chunksize, args.force)
+        return 1 if result['failed'] else 0
+
+    dataset = get_dataset(args.images or 'images')
+    dataset['Label'] = dataset['Label'].apply(map_label)
+    output_dir = args.output or 'images_segmented_label'
+    result = segment_dataset(dataset, output_dir, args.workers, args.chunksize, args.force)
+    if args.verify and verify(dataset, output_dir, args.verify):
+        return 1
+    return 1 if result['failed'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
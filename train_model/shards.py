@@ -0,0 +1,174 @@
+# Daniel Vitor de Oliveira Santos, 716417, Ciência da Computação Coração Eucarístico
+# Guilherme Cosso Lima Pimenta, gclpimenta@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+# Larissa Kaweski Siqueira, larissa.kaweski@sga.pucminas.br, Ciência da Computação Coração Eucarístico
+import io
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+import tensorflow as tf
+
+from preprocessing import get_dataset, map_label, read_image, write_atomic
+from augmentation import VARIANTS, load_variants, to_batch
+
+# Load an image resized with nearest neighbour, like flow_from_dataframe
+def load_image(path, image_size):
+    return cv2.resize(read_image(path)[0], (image_size, image_size), interpolation=cv2.INTER_NEAREST)
+
+# Files of a shard: uint8 images, labels and the description of the rows
+def shard_files(prefix):
+    return prefix + '.images.npy', prefix + '.labels.npy', prefix + '.json'
+
+# Description of the rows of a shard, to know if it has to be written again
+#
+# The rows are the set of images, variants and labels, and the order is the
+# image and variant of each position, which the labels and the features of the
+# shard follow.
+def describe_rows(rows, class_names, image_size):
+    paths = rows['Filepath'].astype(str)
+    variants = rows['Variant'] if 'Variant' in rows else [''] * len(rows)
+    return {
+        'class_names': list(class_names),
+        'image_size': image_size,
+        'rows': [list(row) for row in sorted(zip(paths, variants, rows['Label']))],
+        'order': [[path, variant] for path, variant in zip(paths, variants)],
+    }
+
+# Read the description of a shard, None if it was not written
+def read_description(prefix):
+    try:
+        with open(shard_files(prefix)[2], encoding='utf-8') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+
+# Pack the images of the rows into a uint8 .npy of N x image_size x image_size and a label .npy
+#
+# The images are written in the order of the rows (already shuffled by the
+# notebooks) through a memory map, so the export does not keep the dataset in
+# memory. Rows with a Variant column are the in memory augmentation, each image
+# is read once and its variants are written to their rows. A shard with the
+# same rows in the same order, classes and size is kept.
+#
+# The description is removed before the images and labels are replaced, and
+# written again only after both, so a stopped export is never taken for a
+# packed shard.
+def export_shard(rows, prefix, class_names=None, image_size=224, workers=8):
+    class_names = list(class_names or sorted(rows['Label'].unique()))
+    description = describe_rows(rows, class_names, image_size)
+    images_path, labels_path, description_path = shard_files(prefix)
+    if read_description(prefix) == description and os.path.exists(images_path) and os.path.exists(labels_path):
+        print(f'{prefix}: {len(rows)} images already packed')
+        return prefix
+
+    os.makedirs(os.path.dirname(os.path.abspath(prefix)), exist_ok=True)
+    if os.path.exists(description_path):
+        os.remove(description_path)
+    start_time = time.perf_counter()
+    temp_path = images_path + '.tmp'
+    images = np.lib.format.open_memmap(temp_path, mode='w+', dtype=np.uint8, shape=(len(rows), image_size, image_size))
+
+    # Positions of each image in the shard, with the variant of each position
+    positions = {}
+    variants = rows['Variant'] if 'Variant' in rows else [None] * len(rows)
+    for position, (path, variant) in enumerate(zip(rows['Filepath'].astype(str), variants)):
+        positions.setdefault(path, []).append((position, variant))
+
+    def pack(path):
+        if positions[path][0][1] is None:
+            images[positions[path][0][0]] = load_image(path, image_size)
+            return
+        loaded = load_variants(path, image_size)
+        for position, variant in positions[path]:
+            images[position] = loaded[VARIANTS.index(variant)]
+
+    # OpenCV releases the GIL, so threads decode in parallel
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(pack, positions))
+    images.flush()
+    del images
+    os.replace(temp_path, images_path)
+
+    labels = np.array([class_names.index(label) for label in rows['Label']], dtype=np.int32)
+    data = io.BytesIO()
+    np.save(data, labels)
+    write_atomic(labels_path, data.getvalue())
+    write_atomic(description_path, json.dumps(description).encode('utf-8'))
+    print(f'{prefix}: {len(rows)} images packed in {round(time.perf_counter() - start_time, 2)}s')
+    return prefix
+
+# Open a shard without reading it: images as a memory map, labels and class names
+def read_shard(prefix):
+    images_path, labels_path, _ = shard_files(prefix)
+    images = np.load(images_path, mmap_mode='r')
+    labels = np.load(labels_path)
+    return images, labels, read_description(prefix)['class_names']
+
+# Batches of a shard for Model.fit, each batch a contiguous slice of the memory map
+#
+# The rows were shuffled when the shard was written. With shuffle the order of
+# the batches changes every epoch, but each batch is still a sequential read.
+class ShardSequence(tf.keras.utils.Sequence):
+    def __init__(self, prefix, batch_size=32, shuffle=False, seed=42):
+        super().__init__()
+        self.images, self.labels, self.class_names = read_shard(prefix)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.random = np.random.default_rng(seed)
+        self.order = np.arange(len(self))
+        self.on_epoch_end()
+
+    def __len__(self):
+        return (len(self.labels) + self.batch_size - 1) // self.batch_size
+
+    def __getitem__(self, index):
+        start = self.order[index] * self.batch_size
+        end = start + self.batch_size
+        return to_batch(self.images[start:end], self.labels[start:end], len(self.class_names))
+
+    def on_epoch_end(self):
+        if self.shuffle:
+            self.random.shuffle(self.order)
+
+# tf.data dataset of a shard, reading the batches of the memory map in order
+def shard_dataset(prefix, batch_size=32):
+    sequence = ShardSequence(prefix, batch_size)
+    size = sequence.images.shape[1]
+
+    def load(index):
+        images, labels = sequence[int(index)]
+        return images, labels
+
+    def read(index):
+        images, labels = tf.numpy_function(load, [index], (tf.float32, tf.float32))
+        images.set_shape((None, size, size, 3))
+        labels.set_shape((None, len(sequence.class_names)))
+        return images, labels
+
+    dataset = tf.data.Dataset.range(len(sequence))
+    return dataset.map(read, num_parallel_calls=tf.data.AUTOTUNE).prefetch(tf.data.AUTOTUNE)
+
+# Read the command line options
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Pack the images of a folder into a .npy shard.')
+    parser.add_argument('--images', default='images_segmented_label', help='folder with the images, one folder per label')
+    parser.add_argument('--output', default='shards/dataset', help='prefix of the files of the shard')
+    parser.add_argument('--image-size', type=int, default=224)
+    parser.add_argument('--workers', type=int, default=8)
+    return parser.parse_args(argv)
+
+# Main function
+def main(argv=None):
+    args = parse_args(argv)
+    dataset = get_dataset(args.images)
+    dataset['Label'] = dataset['Label'].apply(map_label)
+    dataset = dataset.sample(frac=1, random_state=42).reset_index(drop=True)
+    export_shard(dataset, args.output, image_size=args.image_size, workers=args.workers)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())